@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import boto3
+from botocore.exceptions import ClientError, BotoCoreError, ProfileNotFound
+from report import WARNING, print_log
+
+
+# Account details are cached on disk per credential identity so short runs skip the IAM and STS round trips
+ACCOUNT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'service-tagger', 'accounts.json')
+# Seconds cached account details are reused for
+ACCOUNT_CACHE_TTL = 24 * 60 * 60
+NONPROD_KEYWORDS = ["dev", "stag", "qa", "nonprod", "non-prod"]
+
+
+def get_account_alias(session, log=print_log):
+    # Returns "" if the account has no alias and None if the alias could not be loaded
+    account_alias = None
+    try:
+        account_alias = session.client('iam').list_account_aliases()["AccountAliases"][0]
+    except IndexError as e:
+        account_alias = ""
+        log("list_account_alias returned a list of length 0, will determine environment at the resource level", WARNING)
+    except ProfileNotFound:
+        log("Unknown error occurred loading users account alias, will determine environment at the resource level", WARNING)
+    except (BotoCoreError, ClientError) as e:
+        log("Unknown error occurred loading users account alias, will determine environment at the resource level", WARNING)
+    except Exception as e:
+        log("Unknown error occurred loading users account alias, will determine environment at the resource level", WARNING)
+    return account_alias
+
+
+def get_regions(session):
+    # Regions enabled for the account
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2/client/describe_regions.html
+    regions = session.client('ec2', region_name='us-east-1').describe_regions()['Regions']
+    return sorted(region['RegionName'] for region in regions)
+
+
+def assume_role_session(role_arn, session=None, session_name='service-tagger'):
+    # Returns a boto3 session with the temporary credentials of the role
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sts/client/assume_role.html
+    session = session if session is not None else boto3.Session()
+    credentials = session.client('sts').assume_role(RoleArn=role_arn, RoleSessionName=session_name)['Credentials']
+    return boto3.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+        region_name=session.region_name,
+    )
+
+
+def credential_identity(session):
+    # Hash of the session's access key, the key itself is never written to disk
+    credentials = session.get_credentials()
+    if credentials is None:
+        return None
+    return hashlib.sha256(credentials.access_key.encode()).hexdigest()
+
+
+class AccountContext:
+    # Alias and ID of the account a session's credentials belong to, shared by every Client of the account.
+    # Both are only loaded when a classification rule first needs them, and then come from the disk cache if possible.
+    def __init__(self, session, identity=None, cache_path=ACCOUNT_CACHE_PATH, ttl=ACCOUNT_CACHE_TTL, log=None):
+        self.session = session
+        # log(text, level) of the run, see Client
+        self.log = log if log is not None else print_log
+        # Key of the disk cache, the role ARN for assumed roles since their temporary keys change on every run
+        self.identity = identity if identity is not None else credential_identity(session)
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.details = None
+        # Keys whose value is only a fallback for this run and is not written to the disk cache
+        self.uncached = set()
+
+    @property
+    def alias(self):
+        return self.get('alias')
+
+    @property
+    def id(self):
+        return self.get('id')
+
+    @property
+    def environment(self):
+        # Environment every resource of the account is in according to its alias, None if the alias does not tell
+        alias = self.alias.lower()
+        if any(keyword in alias for keyword in NONPROD_KEYWORDS):
+            return "development"
+        elif "prod" in alias:
+            return "production"
+        return None
+
+    def get(self, key):
+        with self.lock:
+            if self.details is None:
+                self.details = self.load_cached()
+            if key not in self.details:
+                if key == 'alias':
+                    alias = get_account_alias(self.session, self.log)
+                    if alias is None:
+                        # Classify without an alias for this run, the next run tries again
+                        alias = ""
+                        self.uncached.add('alias')
+                    self.details['alias'] = alias
+                else:
+                    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/sts/client/get_caller_identity.html
+                    self.details['id'] = self.session.client('sts').get_caller_identity()["Account"]
+                self.save_cached()
+            return self.details[key]
+
+    def read_cache_file(self):
+        try:
+            with open(self.cache_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def load_cached(self):
+        if self.identity is None:
+            return {}
+        entry = self.read_cache_file().get(self.identity)
+        if entry is None or time.time() - entry['saved_at'] > self.ttl:
+            return {}
+        return {key: value for key, value in entry.items() if key != 'saved_at'}
+
+    def save_cached(self):
+        if self.identity is None:
+            return
+        cache = self.read_cache_file()
+        cache[self.identity] = {**{key: value for key, value in self.details.items() if key not in self.uncached}, 'saved_at': time.time()}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            # Written to a temporary file first so concurrent runs never read a partial file
+            temporary_path = f'{self.cache_path}.{os.getpid()}.{threading.get_ident()}'
+            with open(temporary_path, 'w') as file:
+                json.dump(cache, file)
+            os.replace(temporary_path, self.cache_path)
+        except OSError as e:
+            self.log(f"Could not cache the account details in {self.cache_path}: {e}", WARNING)
@@ -0,0 +1,636 @@
+import argparse
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import boto3
+import yaml
+from botocore.awsrequest import AWSResponse
+from botocore.hooks import first_non_none_response
+
+import tagger
+from account import AccountContext
+from matcher import TagMatcher, nested_loop_match
+from ratelimit import api_family
+
+# Runs the tagger loop of tagger.py against synthetic accounts served from memory, so how listing, checking and writing
+# scale can be measured without AWS credentials or network. Every boto3 call is answered by a responder registered last
+# on before-call, after the rate limiter and the instrumentation, so everything up to the HTTP request runs as usual.
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+SERVICES = ['ec2', 'rds', 'ecs', 's3', 'dynamodb']
+DEFAULT_SIZES = '1000,10000,100000'
+# Number of arn_parts of the synthetic configs and tag_strings matched against each of them by --matcher
+DEFAULT_MATCHER_PARTS = '10,100,1000'
+MATCHER_STRINGS = 10000
+MATCHER_VALUES = 5
+# Largest page each API returns when the caller does not ask for a smaller one
+PAGE_SIZES = {
+    'ec2': 1000,
+    'rds': 100,
+    'ecs': 100,
+    'ecs.ListServices': 10,
+    'dynamodb': 100,
+    'resourcegroupstaggingapi': 100,
+}
+# Tags of the synthetic resources, resource i gets TAG_PATTERNS[i % len(TAG_PATTERNS)] so every classification rule fires
+TAG_PATTERNS = [
+    {},
+    {'Environment': 'dev'},
+    {'Environment': 'production'},
+    {'Name': 'orders-prod'},
+    {'Name': 'orders-qa'},
+    {'IsProduction': 'true', 'DataClassification': 'India', 'Environment': 'production'},
+    {'IsProduction': 'false'},
+    {},
+    {'Name': 'worker'},
+    {'Environment': 'staging', 'Team': 'payments'},
+]
+VPCS = {'vpc-00000001': 'dev-network', 'vpc-00000002': 'prod-network', 'vpc-00000003': 'shared'}
+SUBNETS = {'subnet-00000001': 'vpc-00000002', 'subnet-00000002': 'vpc-00000002', 'subnet-00000003': 'vpc-00000001', 'subnet-00000004': 'vpc-00000003'}
+
+parser = argparse.ArgumentParser(description="Benchmark listing, checking and writing tags against synthetic accounts, without AWS.")
+parser.add_argument("--services", help=f"comma separated services to benchmark. Default is {','.join(SERVICES)}.", default=",".join(SERVICES))
+parser.add_argument("--sizes", help=f"comma separated number of resources per service. Default is {DEFAULT_SIZES}.", default=DEFAULT_SIZES)
+parser.add_argument("--tags", help="comma separated tags to check and write. Default is IsProduction,DataClassification.", default="IsProduction,DataClassification")
+parser.add_argument("-f", "--file", help="file which holds the mappings to write", default="tag_config.yaml")
+parser.add_argument("--latency", help="milliseconds every API call takes. Default is 0.", type=float, default=0.0)
+parser.add_argument("--throttle-rate", help="share of API calls that are throttled, e.g. 0.05. Default is 0.", type=float, default=0.0)
+parser.add_argument("--api-rate", help="calls per second each API family accepts before it throttles, like AWS does. Default is unlimited.", type=float)
+parser.add_argument("--no-memory", help="do not trace the peak memory, tracemalloc slows the run down", action="store_true")
+parser.add_argument("--json", help="file to write the results to, e.g. to compare them with a later run")
+parser.add_argument("--seed", help="seed of the throttled calls. Default is 0.", type=int, default=0)
+parser.add_argument("--matcher", help="benchmark the compiled tag matcher against the nested loop it replaced instead of the tagger loop", action="store_true")
+parser.add_argument("--matcher-parts", help=f"comma separated number of arn_parts of the synthetic configs of --matcher. Default is {DEFAULT_MATCHER_PARTS}.", default=DEFAULT_MATCHER_PARTS)
+parser.add_argument("tagger_args", nargs=argparse.REMAINDER, help="options passed on to the tagger after --, e.g. -- --bulk-tags --concurrency 8")
+
+
+class ApiError(Exception):
+    def __init__(self, code, status=400):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+
+
+def hex_id(prefix, index):
+    return f'{prefix}-{index:08x}'
+
+
+def id_index(identifier):
+    # Every synthetic identifier ends in -<hex index>
+    return int(identifier.rsplit('-', 1)[1], 16)
+
+
+def tag_pattern(index, offset=0):
+    return TAG_PATTERNS[(index + offset) % len(TAG_PATTERNS)]
+
+
+def key_value_list(tags, key='Key', value='Value'):
+    return [{key: k, value: v} for k, v in tags.items()]
+
+
+def paginate(params, total, item, token_in, token_out, page_size, limit_key=None):
+    # Returns (items, response fields with the next token) for a page of the items 0..total-1, the token is the next index
+    start = int(params.get(token_in) or 0)
+    size = min(params.get(limit_key) or page_size, page_size) if limit_key is not None else page_size
+    end = min(total, start + size)
+    fields = {token_out: str(end)} if end < total else {}
+    return [item(index) for index in range(start, end)], fields
+
+
+def scan(params, groups, match, token_in, token_out, page_size):
+    # Like paginate for a filtered listing over several groups of (count, item) that are numbered one after another
+    position = int(params.get(token_in) or 0)
+    total = sum(count for count, _ in groups)
+    items = []
+    while position < total and len(items) < page_size:
+        index = position
+        for count, item in groups:
+            if index < count:
+                found = item(index)
+                if match(found):
+                    items.append(found)
+                break
+            index -= count
+        position += 1
+    return items, {token_out: str(position)} if position < total else {}
+
+
+def filter_values(params, name):
+    for item in params.get('Filters', []):
+        if item['Name'] == name:
+            return item['Values']
+    return None
+
+
+class Common:
+    # Calls every service run makes: the account details and the VPC and subnet lookups
+    def __init__(self):
+        self.handlers = {
+            ('iam', 'ListAccountAliases'): lambda params: {'AccountAliases': ['benchmark']},
+            ('sts', 'GetCallerIdentity'): lambda params: {'Account': ACCOUNT_ID, 'Arn': f'arn:aws:iam::{ACCOUNT_ID}:user/benchmark', 'UserId': 'benchmark'},
+            ('ec2', 'DescribeVpcs'): lambda params: {'Vpcs': [{'VpcId': vpc_id, 'Tags': [{'Key': 'Name', 'Value': name}]} for vpc_id, name in VPCS.items()]},
+            ('ec2', 'DescribeSubnets'): lambda params: {'Subnets': [{'SubnetId': subnet_id, 'VpcId': vpc_id} for subnet_id, vpc_id in SUBNETS.items()]},
+            ('ec2', 'DescribeRouteTables'): lambda params: {'RouteTables': [
+                {'VpcId': 'vpc-00000002', 'Routes': [{'GatewayId': 'igw-00000001'}], 'Associations': [{'Main': True}]},
+                {'VpcId': 'vpc-00000002', 'Routes': [{'GatewayId': 'local'}], 'Associations': [{'Main': False, 'SubnetId': 'subnet-00000002'}]},
+            ]},
+            ('resourcegroupstaggingapi', 'TagResources'): lambda params: {'FailedResourcesMap': {}},
+            ('resourcegroupstaggingapi', 'GetResources'): self.get_resources,
+        }
+
+    def tag_mappings(self):
+        # [(tagging API resource type, count, index -> (arn, tags))] of every resource of the service
+        return []
+
+    def get_resources(self, params):
+        keys = [tag_filter['Key'] for tag_filter in params.get('TagFilters', [])]
+        types = params.get('ResourceTypeFilters') or None
+        groups = [(count, mapping) for resource_type, count, mapping in self.tag_mappings() if types is None or resource_type in types]
+        mappings, fields = scan(params, groups, lambda found: len(found[1]) > 0 and all(key in found[1] for key in keys),
+                                'PaginationToken', 'PaginationToken', PAGE_SIZES['resourcegroupstaggingapi'])
+        return {'ResourceTagMappingList': [{'ResourceARN': arn, 'Tags': key_value_list(tags)} for arn, tags in mappings], **fields}
+
+
+class Ec2Inventory(Common):
+    def __init__(self, size):
+        super().__init__()
+        self.instances = size // 4
+        self.volumes = size // 2
+        self.snapshots = size - self.instances - self.volumes
+        self.handlers.update({
+            ('ec2', 'DescribeInstances'): self.describe_instances,
+            ('ec2', 'DescribeVolumes'): self.describe_volumes,
+            ('ec2', 'DescribeSnapshots'): lambda params: self.page(params, 'Snapshots', self.snapshots, self.snapshot),
+            ('ec2', 'DescribeTags'): self.describe_tags,
+            ('ec2', 'CreateTags'): lambda params: {},
+        })
+
+    def page(self, params, key, total, item):
+        items, fields = paginate(params, total, item, 'NextToken', 'NextToken', PAGE_SIZES['ec2'], 'MaxResults')
+        return {key: items, **fields}
+
+    def instance(self, index):
+        return {
+            'InstanceId': hex_id('i', index),
+            'VpcId': list(VPCS)[index % len(VPCS)],
+            'NetworkInterfaces': [{'SubnetId': list(SUBNETS)[index % len(SUBNETS)]}],
+            'Tags': key_value_list(tag_pattern(index)),
+        }
+
+    def volume(self, index):
+        volume = {
+            'VolumeId': hex_id('vol', index),
+            # Every other volume is attached, every third one was created from a snapshot
+            'Attachments': [{'InstanceId': hex_id('i', index // 2 % self.instances)}] if index % 2 == 0 and self.instances > 0 else [],
+            'SnapshotId': hex_id('snap', index // 3) if index % 3 == 0 and index // 3 < self.snapshots else '',
+        }
+        tags = tag_pattern(index, 3)
+        if len(tags) > 0:
+            volume['Tags'] = key_value_list(tags)
+        return volume
+
+    def snapshot(self, index):
+        snapshot = {'SnapshotId': hex_id('snap', index), 'VolumeId': hex_id('vol', index * 3 % max(self.volumes, 1))}
+        tags = tag_pattern(index, 7)
+        if len(tags) > 0:
+            snapshot['Tags'] = key_value_list(tags)
+        return snapshot
+
+    def describe_instances(self, params):
+        ids = filter_values(params, 'instance-id')
+        if ids is not None:
+            instances = [self.instance(id_index(instance_id)) for instance_id in ids if id_index(instance_id) < self.instances]
+            return {'Reservations': [{'Instances': [instance]} for instance in instances]}
+        response = self.page(params, 'Instances', self.instances, self.instance)
+        response['Reservations'] = [{'Instances': [instance]} for instance in response.pop('Instances')]
+        return response
+
+    def describe_volumes(self, params):
+        ids = filter_values(params, 'snapshot-id')
+        if ids is not None:
+            # The volume created from snapshot s is volume 3s
+            return {'Volumes': [self.volume(id_index(snapshot_id) * 3) for snapshot_id in ids if id_index(snapshot_id) * 3 < self.volumes]}
+        return self.page(params, 'Volumes', self.volumes, self.volume)
+
+    def resource_tags(self, resource_id):
+        prefix = resource_id.split('-')[0]
+        index = id_index(resource_id)
+        return tag_pattern(index, {'i': 0, 'vol': 3, 'snap': 7}[prefix]), {'i': 'instance', 'vol': 'volume', 'snap': 'snapshot'}[prefix]
+
+    def describe_tags(self, params):
+        ids = filter_values(params, 'resource-id')
+        if ids is not None:
+            tags = []
+            for resource_id in ids:
+                resource_tags, resource_type = self.resource_tags(resource_id)
+                tags.extend({'Key': k, 'Value': v, 'ResourceId': resource_id, 'ResourceType': resource_type} for k, v in resource_tags.items())
+            return {'Tags': tags}
+        keys = filter_values(params, 'key') or []
+        types = filter_values(params, 'resource-type') or ['instance', 'volume', 'snapshot']
+        groups = [(count, functools.partial(lambda prefix, index: hex_id(prefix, index), prefix))
+                  for resource_type, count, prefix in [('instance', self.instances, 'i'), ('volume', self.volumes, 'vol'), ('snapshot', self.snapshots, 'snap')]
+                  if resource_type in types]
+        ids, fields = scan(params, groups, lambda resource_id: any(key in self.resource_tags(resource_id)[0] for key in keys), 'NextToken', 'NextToken', PAGE_SIZES['ec2'])
+        tags = []
+        for resource_id in ids:
+            resource_tags, resource_type = self.resource_tags(resource_id)
+            tags.extend({'Key': key, 'Value': resource_tags[key], 'ResourceId': resource_id, 'ResourceType': resource_type} for key in keys if key in resource_tags)
+        return {'Tags': tags, **fields}
+
+    def tag_mappings(self):
+        return [
+            ('ec2:instance', self.instances, lambda index: (f'arn:aws:ec2:{REGION}:{ACCOUNT_ID}:instance/{hex_id("i", index)}', tag_pattern(index))),
+            ('ec2:volume', self.volumes, lambda index: (f'arn:aws:ec2:{REGION}:{ACCOUNT_ID}:volume/{hex_id("vol", index)}', tag_pattern(index, 3))),
+            ('ec2:snapshot', self.snapshots, lambda index: (f'arn:aws:ec2:{REGION}::snapshot/{hex_id("snap", index)}', tag_pattern(index, 7))),
+        ]
+
+
+class RdsInventory(Common):
+    def __init__(self, size):
+        super().__init__()
+        self.clusters = max(1, size // 20)
+        self.instances = size * 3 // 10
+        self.cluster_snapshots = size * 15 // 100
+        self.snapshots = size - self.clusters - self.instances - self.cluster_snapshots
+        self.handlers.update({
+            ('rds', 'DescribeDBClusters'): lambda params: self.describe(params, 'DBClusters', 'db-cluster-id', self.clusters, self.cluster),
+            ('rds', 'DescribeDBInstances'): lambda params: self.describe(params, 'DBInstances', 'db-instance-id', self.instances, self.instance),
+            ('rds', 'DescribeDBClusterSnapshots'): lambda params: self.describe(params, 'DBClusterSnapshots', None, self.cluster_snapshots, self.cluster_snapshot),
+            ('rds', 'DescribeDBSnapshots'): lambda params: self.describe(params, 'DBSnapshots', None, self.snapshots, self.snapshot),
+            ('rds', 'ListTagsForResource'): lambda params: {'TagList': key_value_list(self.arn_tags(params['ResourceName']))},
+            ('rds', 'AddTagsToResource'): lambda params: {},
+        })
+
+    def arn(self, resource_type, index):
+        return f'arn:aws:rds:{REGION}:{ACCOUNT_ID}:{resource_type}:{hex_id(resource_type, index)}'
+
+    def arn_tags(self, arn):
+        resource_type = arn.split(':')[5]
+        return tag_pattern(id_index(arn), {'cluster': 0, 'db': 1, 'cluster-snapshot': 2, 'snapshot': 5}[resource_type])
+
+    def cluster(self, index):
+        return {'DBClusterIdentifier': hex_id('cluster', index), 'DBClusterArn': self.arn('cluster', index), 'TagList': key_value_list(tag_pattern(index))}
+
+    def instance(self, index):
+        instance = {'DBInstanceIdentifier': hex_id('db', index), 'DBInstanceArn': self.arn('db', index), 'TagList': key_value_list(tag_pattern(index, 1))}
+        # Every third instance belongs to a cluster, the others are classified from their VPC and tags
+        if index % 3 == 0:
+            instance['DBClusterIdentifier'] = hex_id('cluster', index % self.clusters)
+        else:
+            instance['DBSubnetGroup'] = {'VpcId': list(VPCS)[index % len(VPCS)]}
+        return instance
+
+    def cluster_snapshot(self, index):
+        return {
+            'DBClusterSnapshotArn': self.arn('cluster-snapshot', index),
+            'DBClusterIdentifier': hex_id('cluster', index % self.clusters),
+            'VpcId': list(VPCS)[index % len(VPCS)],
+            'TagList': key_value_list(tag_pattern(index, 2)),
+        }
+
+    def snapshot(self, index):
+        snapshot = {'DBSnapshotArn': self.arn('snapshot', index), 'TagList': key_value_list(tag_pattern(index, 5))}
+        # Every fourth snapshot belongs to an instance that no longer exists
+        snapshot['DBInstanceIdentifier'] = hex_id('db', index % max(self.instances, 1)) if index % 4 else hex_id('deleted', index)
+        return snapshot
+
+    def describe(self, params, key, filter_name, total, item):
+        ids = filter_values(params, filter_name) if filter_name is not None else None
+        if ids is not None:
+            return {key: [item(id_index(identifier)) for identifier in ids if id_index(identifier) < total]}
+        items, fields = paginate(params, total, item, 'Marker', 'Marker', PAGE_SIZES['rds'], 'MaxRecords')
+        return {key: items, **fields}
+
+    def tag_mappings(self):
+        return [(f'rds:{resource_type}', count, functools.partial(lambda resource_type, index: (self.arn(resource_type, index), self.arn_tags(self.arn(resource_type, index))), resource_type))
+                for resource_type, count in [('cluster', self.clusters), ('db', self.instances), ('cluster-snapshot', self.cluster_snapshots), ('snapshot', self.snapshots)]]
+
+
+class EcsInventory(Common):
+    def __init__(self, size):
+        super().__init__()
+        self.clusters = max(1, size // 500)
+        self.services = size // 5
+        self.tasks = max(0, size - self.clusters - self.services)
+        self.handlers.update({
+            ('ecs', 'ListClusters'): self.list_clusters,
+            ('ecs', 'DescribeClusters'): lambda params: {'clusters': [self.cluster(id_index(arn)) for arn in params['clusters']]},
+            ('ecs', 'ListServices'): lambda params: self.list_children(params, 'serviceArns', self.services, self.service_arn, PAGE_SIZES['ecs.ListServices']),
+            ('ecs', 'DescribeServices'): lambda params: {'services': [self.child('serviceArn', arn) for arn in params['services']]},
+            ('ecs', 'ListTasks'): lambda params: self.list_children(params, 'taskArns', self.tasks, self.task_arn, PAGE_SIZES['ecs']),
+            ('ecs', 'DescribeTasks'): lambda params: {'tasks': [{**self.child('taskArn', arn), 'containers': []} for arn in params['tasks']]},
+            ('ecs', 'ListTagsForResource'): lambda params: {'tags': key_value_list(self.arn_tags(params['resourceArn']), 'key', 'value')},
+            ('ecs', 'TagResource'): lambda params: {},
+        })
+
+    def cluster_name(self, index):
+        return f"{['dev', 'prod', 'apps', 'qa'][index % 4]}-{index:08x}"
+
+    def cluster_arn(self, index):
+        return f'arn:aws:ecs:{REGION}:{ACCOUNT_ID}:cluster/{self.cluster_name(index)}'
+
+    def service_arn(self, index):
+        return f'arn:aws:ecs:{REGION}:{ACCOUNT_ID}:service/{self.cluster_name(index % self.clusters)}/{hex_id("service", index)}'
+
+    def task_arn(self, index):
+        return f'arn:aws:ecs:{REGION}:{ACCOUNT_ID}:task/{self.cluster_name(index % self.clusters)}/{hex_id("task", index)}'
+
+    def arn_tags(self, arn):
+        return tag_pattern(id_index(arn), {'cluster': 0, 'service': 4, 'task': 8}[arn.split(':')[5].split('/')[0]])
+
+    def cluster(self, index):
+        return {'clusterArn': self.cluster_arn(index), 'clusterName': self.cluster_name(index), 'tags': key_value_list(tag_pattern(index), 'key', 'value')}
+
+    def child(self, key, arn):
+        return {key: arn, 'clusterArn': self.cluster_arn(id_index(arn) % self.clusters), 'tags': key_value_list(self.arn_tags(arn), 'key', 'value')}
+
+    def list_clusters(self, params):
+        arns, fields = paginate(params, self.clusters, self.cluster_arn, 'nextToken', 'nextToken', PAGE_SIZES['ecs'], 'maxResults')
+        return {'clusterArns': arns, **fields}
+
+    def list_children(self, params, key, total, arn, page_size):
+        # Services and tasks are spread over the clusters round robin, child j of cluster c has the index c + j * clusters
+        cluster = id_index(params['cluster'])
+        count = max(0, (total - cluster + self.clusters - 1) // self.clusters)
+        arns, fields = paginate(params, count, lambda position: arn(cluster + position * self.clusters), 'nextToken', 'nextToken', page_size, 'maxResults')
+        return {key: arns, **fields}
+
+    def tag_mappings(self):
+        return [
+            ('ecs:cluster', self.clusters, lambda index: (self.cluster_arn(index), tag_pattern(index))),
+            ('ecs:service', self.services, lambda index: (self.service_arn(index), tag_pattern(index, 4))),
+            ('ecs:task', self.tasks, lambda index: (self.task_arn(index), tag_pattern(index, 8))),
+        ]
+
+
+class S3Inventory(Common):
+    def __init__(self, size):
+        super().__init__()
+        self.buckets = size
+        self.handlers.update({
+            ('s3', 'ListBuckets'): lambda params: {'Buckets': [{'Name': self.name(index), 'BucketRegion': REGION} for index in range(self.buckets)]},
+            ('s3', 'GetBucketPolicyStatus'): self.get_bucket_policy_status,
+            ('s3', 'GetPublicAccessBlock'): self.get_public_access_block,
+            ('s3', 'GetBucketAcl'): lambda params: {'Grants': [{'Grantee': {'Type': 'Group', 'URI': 'http://acs.amazonaws.com/groups/global/AllUsers'}, 'Permission': 'READ'}] if id_index(params['Bucket']) % 2 else []},
+            ('s3', 'GetBucketTagging'): self.get_bucket_tagging,
+            ('s3', 'PutBucketTagging'): lambda params: {},
+        })
+
+    def name(self, index):
+        return f"{['app', 'prod-data', 'dev-logs', 'assets', 'qa-reports'][index % 5]}-{index:08x}"
+
+    def get_bucket_policy_status(self, params):
+        # One in five buckets has a public policy, one a private one, the others none
+        index = id_index(params['Bucket'])
+        if index % 5 > 1:
+            raise ApiError('NoSuchBucketPolicy', 404)
+        return {'PolicyStatus': {'IsPublic': index % 5 == 0}}
+
+    def get_public_access_block(self, params):
+        index = id_index(params['Bucket'])
+        if index % 5 == 4:
+            raise ApiError('NoSuchPublicAccessBlockConfiguration', 404)
+        return {'PublicAccessBlockConfiguration': {'BlockPublicAcls': index % 5 != 3, 'BlockPublicPolicy': True}}
+
+    def get_bucket_tagging(self, params):
+        tags = tag_pattern(id_index(params['Bucket']))
+        if len(tags) == 0:
+            raise ApiError('NoSuchTagSet', 404)
+        return {'TagSet': key_value_list(tags)}
+
+    def tag_mappings(self):
+        return [('s3:bucket', self.buckets, lambda index: (f'arn:aws:s3:::{self.name(index)}', tag_pattern(index)))]
+
+
+class DynamoDbInventory(Common):
+    def __init__(self, size):
+        super().__init__()
+        self.tables = size
+        self.handlers.update({
+            ('dynamodb', 'ListTables'): self.list_tables,
+            ('dynamodb', 'ListTagsOfResource'): lambda params: {'Tags': key_value_list(tag_pattern(id_index(params['ResourceArn'])))},
+            ('dynamodb', 'TagResource'): lambda params: {},
+        })
+
+    def name(self, index):
+        return f"{['orders', 'sessions', 'dev-cache', 'prod-users'][index % 4]}-{index:08x}"
+
+    def list_tables(self, params):
+        start = id_index(params['ExclusiveStartTableName']) + 1 if 'ExclusiveStartTableName' in params else 0
+        end = min(self.tables, start + min(params.get('Limit') or PAGE_SIZES['dynamodb'], PAGE_SIZES['dynamodb']))
+        response = {'TableNames': [self.name(index) for index in range(start, end)]}
+        if end < self.tables:
+            response['LastEvaluatedTableName'] = self.name(end - 1)
+        return response
+
+    def tag_mappings(self):
+        return [('dynamodb:table', self.tables, lambda index: (f'arn:aws:dynamodb:{REGION}:{ACCOUNT_ID}:table/{self.name(index)}', tag_pattern(index)))]
+
+
+INVENTORIES = {
+    'ec2': Ec2Inventory,
+    'rds': RdsInventory,
+    'ecs': EcsInventory,
+    's3': S3Inventory,
+    'dynamodb': DynamoDbInventory,
+}
+
+
+class FakeAws:
+    # Answers the calls of every client of a session from a synthetic inventory, with optional latency and throttling.
+    # Throttled attempts go through the client's needs-retry handlers, so botocore's retry mode and the tagger's rate limiter
+    # react to them as they would to AWS.
+    def __init__(self, inventory, latency=0.0, throttle_rate=0.0, api_rate=None, seed=0):
+        self.inventory = inventory
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.api_rate = api_rate
+        self.random = random.Random(seed)
+        # {api family: [tokens, last refill]} of --api-rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def install(self, session):
+        # Clients are hooked up through a base class of their client class since the responder needs the client's own events
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/events.html#creating-client-class
+        fake = self
+
+        class FakeAwsClient:
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.meta.events.register('before-parameter-build', fake.remember_params)
+                self.meta.events.register_last('before-call', functools.partial(fake.respond, self))
+
+        session.events.register('creating-client-class', lambda base_classes, **kwargs: base_classes.insert(0, FakeAwsClient))
+
+    def remember_params(self, params, context, **kwargs):
+        # before-call only gets the serialized request, the responder answers from the call's parameters
+        context['benchmark_params'] = params
+
+    def throttled(self, model):
+        with self.lock:
+            if self.throttle_rate > 0 and self.random.random() < self.throttle_rate:
+                return True
+            if self.api_rate is None:
+                return False
+            now = time.monotonic()
+            bucket = self.buckets.setdefault(api_family(model), [self.api_rate, now])
+            bucket[0] = min(self.api_rate, bucket[0] + (now - bucket[1]) * self.api_rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return True
+            bucket[0] -= 1
+            return False
+
+    def respond(self, client, model, params, context, **kwargs):
+        handler = self.inventory.handlers.get((model.service_model.service_name, model.name))
+        if handler is None:
+            raise NotImplementedError(f"The benchmark inventory does not answer {model.service_model.service_name}.{model.name}")
+        attempts = 1
+        while True:
+            if self.latency > 0:
+                time.sleep(self.latency)
+            if not self.throttled(model):
+                break
+            response = (AWSResponse(None, 400, {}, None), {'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}, 'ResponseMetadata': {'HTTPStatusCode': 400}})
+            delay = first_non_none_response(client.meta.events.emit(
+                f'needs-retry.{model.service_model.service_id.hyphenize()}.{model.name}',
+                response=response, endpoint=None, operation=model, attempts=attempts, caught_exception=None, request_dict=params,
+            ))
+            if delay is None or delay is False:
+                response[1]['ResponseMetadata']['RetryAttempts'] = attempts - 1
+                return response
+            time.sleep(delay)
+            attempts += 1
+        try:
+            parsed = handler(context.get('benchmark_params', {}))
+            status = 200
+        except ApiError as e:
+            parsed = {'Error': {'Code': e.code, 'Message': e.code}}
+            status = e.status
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': status, 'RetryAttempts': attempts - 1}
+        return AWSResponse(None, status, {}, None), parsed
+
+
+def run(service, size, options, target_tags, compiled_matcher, workdir):
+    # Runs the region loop of tagger.py once for a fresh synthetic account and returns its measurements
+    fake = FakeAws(INVENTORIES[service](size), options.latency / 1000, options.throttle_rate, options.api_rate, options.seed)
+    session = boto3.Session(aws_access_key_id='benchmark', aws_secret_access_key='benchmark', region_name=REGION)
+    fake.install(session)
+    account = AccountContext(session, cache_path=os.path.join(workdir, f'accounts-{service}-{size}.json'), log=lambda text, level: tagger.log(None, text, level))
+    tagger_args = [argument for argument in options.tagger_args if argument != '--']
+    parsed_args = tagger.parser.parse_args([service, ",".join(target_tags), '--write', '--log-level', 'warning', '--journal', os.path.join(workdir, 'journal.jsonl')] + tagger_args)
+    parsed_args.command = 'check'
+    if parsed_args.types is not None:
+        parsed_args.types = tagger.parse_types(service, parsed_args.types)
+    tagger.configure(parsed_args, target_tags, compiled_matcher)
+
+    if not options.no_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    report = tagger.run_region(REGION, session, account, service)
+    wall_time = time.perf_counter() - started
+    peak_memory = None
+    if not options.no_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    operations = report['metrics']['operations']
+    return {
+        'service': service,
+        'size': size,
+        'checked': report['checked'],
+        'with_new_tags': report['with_new_tags'],
+        'failed': report['failed'],
+        'wall_time': round(wall_time, 3),
+        'resources_per_second': round(report['checked'] / max(wall_time, 0.001), 1),
+        'api_calls': sum(operation['calls'] for operation in operations.values()),
+        'retries': sum(operation['retries'] for operation in operations.values()),
+        'peak_memory_mib': round(peak_memory / 1024 / 1024, 1) if peak_memory is not None else None,
+        'calls': {key: operation['calls'] for key, operation in sorted(operations.items())},
+        'phases': {name: round(phase['seconds'], 3) for name, phase in sorted(report['metrics']['phases'].items())},
+    }
+
+
+def run_matcher(parts, options):
+    # Matches MATCHER_STRINGS tag_strings, half of them containing an arn_part, against a config of parts arn_parts
+    # with TagMatcher and with the nested loop, and checks that both decide the same
+    rng = random.Random(options.seed)
+    arn_parts = [f'{rng.choice(["svc", "app", "data", "prod", "dev"])}-{index:05d}' for index in range(parts)]
+    tags_config = {'Tag': {f'value-{value}': arn_parts[value::MATCHER_VALUES] for value in range(MATCHER_VALUES)}}
+    tag_strings = [f'arn:aws:ec2:{REGION}:{ACCOUNT_ID}:instance/i-{index:08x}-{rng.choice(arn_parts) if index % 2 == 0 else "production"}' for index in range(MATCHER_STRINGS)]
+
+    started = time.perf_counter()
+    compiled_matcher = TagMatcher(tags_config, ['Tag'])
+    compile_time = time.perf_counter() - started
+    started = time.perf_counter()
+    matched = [compiled_matcher.match('Tag', tag_string) for tag_string in tag_strings]
+    matcher_time = time.perf_counter() - started
+    started = time.perf_counter()
+    expected = [nested_loop_match(tags_config, 'Tag', tag_string) for tag_string in tag_strings]
+    nested_loop_time = time.perf_counter() - started
+    if matched != expected:
+        raise AssertionError(f"TagMatcher and the nested loop disagree on a config of {parts} arn_parts")
+    return {
+        'parts': parts,
+        'strings': MATCHER_STRINGS,
+        'compile_ms': round(compile_time * 1000, 3),
+        'matcher_us_per_string': round(matcher_time / MATCHER_STRINGS * 1000000, 3),
+        'nested_loop_us_per_string': round(nested_loop_time / MATCHER_STRINGS * 1000000, 3),
+        'speedup': round(nested_loop_time / max(matcher_time, 0.000001), 1),
+    }
+
+
+def matcher_main(options):
+    results = []
+    print(f"{'arn_parts':>9} {'strings':>8} {'compile ms':>10} {'matcher us':>10} {'loop us':>10} {'speedup':>8}")
+    for parts in (int(parts) for parts in options.matcher_parts.split(",")):
+        result = run_matcher(parts, options)
+        print(f"{result['parts']:>9} {result['strings']:>8} {result['compile_ms']:>10.2f} {result['matcher_us_per_string']:>10.2f} "
+              f"{result['nested_loop_us_per_string']:>10.2f} {result['speedup']:>8.1f}", flush=True)
+        results.append(result)
+    if options.json is not None:
+        with open(options.json, 'w') as file:
+            json.dump({'options': {key: value for key, value in vars(options).items() if key != 'json'}, 'results': results}, file, indent=2)
+
+
+def print_result(result):
+    memory = f"{result['peak_memory_mib']:>9.1f}" if result['peak_memory_mib'] is not None else f"{'-':>9}"
+    print(f"{result['service']:<10} {result['size']:>8} {result['checked']:>8} {result['with_new_tags']:>8} {result['wall_time']:>9.2f} "
+          f"{result['resources_per_second']:>10.1f} {result['api_calls']:>9} {result['retries']:>8} {memory}", flush=True)
+
+
+def main():
+    options = parser.parse_args()
+    if options.matcher:
+        matcher_main(options)
+        return
+    target_tags = sorted(options.tags.split(","))
+    with open(options.file) as file:
+        compiled_matcher = TagMatcher(yaml.safe_load(file), target_tags)
+    results = []
+    print(f"{'service':<10} {'size':>8} {'checked':>8} {'tagged':>8} {'wall s':>9} {'res/s':>10} {'API calls':>9} {'retries':>8} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for service in options.services.split(","):
+            if service not in INVENTORIES:
+                print(f"Service {service} has no synthetic inventory. Available: {', '.join(INVENTORIES)}")
+                exit()
+            for size in (int(size) for size in options.sizes.split(",")):
+                result = run(service, size, options, target_tags, compiled_matcher, workdir)
+                print_result(result)
+                results.append(result)
+    if not options.no_memory:
+        print("Wall times include the tracemalloc overhead, use --no-memory for plain wall times.")
+    if options.json is not None:
+        with open(options.json, 'w') as file:
+            json.dump({'options': {key: value for key, value in vars(options).items() if key != 'json'}, 'results': results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+from account import NONPROD_KEYWORDS
+
+
+# Steps of a rule table, evaluated in order until one of them decides the environment of a resource
+# The account alias has a nonprod keyword or 'prod'
+ACCOUNT = 'account'
+# The name of the resource's VPC has a nonprod keyword or 'prod'
+VPC = 'vpc'
+# The name of the resource itself (e.g. an S3 bucket) has a nonprod keyword or 'prod'
+RESOURCE_NAME = 'resource-name'
+# An Environment tag with a nonprod keyword is development, any other Environment tag production
+ENVIRONMENT_TAG = 'environment-tag'
+# A Name tag with a nonprod keyword is development
+NAME_TAG_NONPROD = 'name-tag-nonprod'
+# A Name tag with 'production', or with 'prod' and no nonprod keyword, is production
+NAME_TAG_PROD = 'name-tag-prod'
+
+# {service:resource type: (steps, environment if no step decides)} of every resource that is classified on its own.
+# The tag steps always come last so the tags are only read when the account, VPC and name do not decide.
+# Resources classified from a parent (ECS services and tasks, RDS instances of a cluster and snapshots of an instance,
+# attached EC2 volumes and snapshots of a volume) only fall back to these rules when the parent is unknown.
+RULES = {
+    'lambda:function': ([ACCOUNT, VPC, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'efs:file-system': ([ACCOUNT, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'dynamodb:table': ([ACCOUNT, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    # ECR and ECS do not look at the account alias
+    'ecr:repository': ([RESOURCE_NAME, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'ecs:cluster': ([RESOURCE_NAME, ENVIRONMENT_TAG, NAME_TAG_PROD], 'production'),
+    # Buckets are development unless something says production
+    's3:bucket': ([ACCOUNT, RESOURCE_NAME, ENVIRONMENT_TAG, NAME_TAG_PROD], 'development'),
+    'rds:cluster': ([ACCOUNT, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'rds:db': ([ACCOUNT, VPC, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'rds:cluster-snapshot': ([ACCOUNT, VPC, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'rds:snapshot': ([ACCOUNT, VPC, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'ec2:instance': ([ACCOUNT, VPC, ENVIRONMENT_TAG, NAME_TAG_NONPROD], 'production'),
+    'ec2:volume': ([ACCOUNT, ENVIRONMENT_TAG, NAME_TAG_NONPROD, NAME_TAG_PROD], 'production'),
+    'ec2:snapshot': ([ACCOUNT, ENVIRONMENT_TAG, NAME_TAG_NONPROD, NAME_TAG_PROD], 'production'),
+}
+
+
+def is_nonprod(value):
+    value = value.lower()
+    return any(keyword in value for keyword in NONPROD_KEYWORDS)
+
+
+def normalize_tags(tags):
+    # Returns the values of the Environment and Name tags, whatever the case of their keys, in a single pass.
+    # Tags can be a {key: value} dict or a describe call's list of {'Key': ..., 'Value': ...} (ECS uses lowercase keys).
+    if isinstance(tags, dict):
+        items = tags.items()
+    else:
+        items = ((tag.get('Key', tag.get('key')), tag.get('Value', tag.get('value'))) for tag in tags)
+    environments = []
+    names = []
+    for key, value in items:
+        key = key.lower()
+        if key == 'environment':
+            environments.append(value)
+        elif key == 'name':
+            names.append(value)
+    return tuple(environments), tuple(names)
+
+
+class Classifier:
+    # Decides the IsProduction environment of a resource from the rule table of its type. The account's decision is
+    # resolved once, and the decisions for a VPC or resource name and for a combination of Environment and Name tag values
+    # are memoized, so most resources cost a few dict lookups. Resources classified the same share one memo entry.
+    def __init__(self, account):
+        self.account = account
+        self.account_resolved = False
+        self.account_environment = None
+        # {name: environment or None} of VPC and resource names
+        self.name_environments = {}
+        # {(rule, environment tag values, name tag values): environment}
+        self.tag_environments = {}
+
+    def environment(self, rule, vpc_name=None, name=None, tags=None):
+        # vpc_name and tags can be callables, they are only called once a step of the rule needs them
+        # so the VPCs are not listed and the tags are not read for resources an earlier step decides
+        steps, default = RULES[rule]
+        for step in steps:
+            if step == ACCOUNT:
+                environment = self.get_account_environment()
+            elif step == VPC:
+                environment = self.name_environment(vpc_name() if callable(vpc_name) else vpc_name)
+            elif step == RESOURCE_NAME:
+                environment = self.name_environment(name)
+            else:
+                return self.tag_environment(rule, tags() if callable(tags) else tags)
+            if environment is not None:
+                return environment
+        return default
+
+    def get_account_environment(self):
+        # The alias is only loaded once a rule needs it, and then decides for every resource of the account
+        if not self.account_resolved:
+            self.account_environment = self.account.environment
+            self.account_resolved = True
+        return self.account_environment
+
+    def name_environment(self, name):
+        if name not in self.name_environments:
+            if is_nonprod(name):
+                self.name_environments[name] = "development"
+            elif "prod" in name.lower():
+                self.name_environments[name] = "production"
+            else:
+                self.name_environments[name] = None
+        return self.name_environments[name]
+
+    def tag_environment(self, rule, tags):
+        environments, names = normalize_tags(tags or [])
+        key = (rule, environments, names)
+        if key not in self.tag_environments:
+            self.tag_environments[key] = self.decide_tags(rule, environments, names)
+        return self.tag_environments[key]
+
+    def decide_tags(self, rule, environments, names):
+        steps, default = RULES[rule]
+        for step in steps:
+            if step == ENVIRONMENT_TAG:
+                if any(is_nonprod(value) for value in environments):
+                    return "development"
+                if len(environments) > 0:
+                    return "production"
+            elif step == NAME_TAG_NONPROD:
+                if any(is_nonprod(value) for value in names):
+                    return "development"
+            elif step == NAME_TAG_PROD:
+                if any('production' in value.lower() or ('prod' in value.lower() and not is_nonprod(value)) for value in names):
+                    return "production"
+        return default
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from records import Resource
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'service-tagger', 'inventory.sqlite')
+# Minutes a cached listing is reused before the service is listed again
+DEFAULT_TTL = 60
+# Resources inserted per transaction, short transactions let the listings of several regions be saved at the same time
+INSERT_BATCH_SIZE = 1000
+# Seconds to wait for another writer to release the database
+LOCK_TIMEOUT = 60
+
+SCHEMA = [
+    # One row per listing of a service, the tag_strings depend on the target tags they were classified for
+    '''CREATE TABLE IF NOT EXISTS listings (
+        account TEXT, region TEXT, service TEXT, target_tags TEXT, listing_id TEXT, listed_at REAL,
+        PRIMARY KEY (account, region, service, target_tags))''',
+    # Resources of a listing are inserted under a new listing_id and only become visible once the listing is complete
+    '''CREATE TABLE IF NOT EXISTS resources (
+        listing_id TEXT, position INTEGER,
+        tagger_id TEXT, arn TEXT, type TEXT, tag_string TEXT, parent_id TEXT, tags TEXT, vpc_id TEXT, subnet_ids TEXT,
+        PRIMARY KEY (listing_id, position))''',
+    # Last known tags of every resource, shared by the listings of all target tags
+    '''CREATE TABLE IF NOT EXISTS tags (
+        account TEXT, region TEXT, service TEXT, tagger_id TEXT, tags TEXT, saved_at REAL,
+        PRIMARY KEY (account, region, service, tagger_id))''',
+]
+
+
+class InventoryCache:
+    # SQLite store of listed resources and their tags so that re-runs within the TTL (e.g. a dry run followed by a write)
+    # do not list and classify the whole account again.
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL):
+        self.ttl = ttl * 60
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def load_resources(self, account, region, service, target_tags):
+        # Returns the cached resources in listing order, or None if the service has not been listed within the TTL
+        key = (account, region, service, ','.join(target_tags))
+        row = self.db.execute('SELECT listing_id, listed_at FROM listings WHERE account = ? AND region = ? AND service = ? AND target_tags = ?', key).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        rows = self.db.execute('''SELECT tagger_id, arn, type, tag_string, parent_id, tags, vpc_id, subnet_ids FROM resources
+            WHERE listing_id = ? ORDER BY position''', (row[0],))
+        return [Resource(tagger_id, arn, type, tag_string, parent_id, json.loads(tags), vpc_id, tuple(json.loads(subnet_ids)))
+                for tagger_id, arn, type, tag_string, parent_id, tags, vpc_id, subnet_ids in rows]
+
+    def save_resources(self, account, region, service, target_tags, resources):
+        # Passes the resources through while storing them, so a streamed listing is cached without being kept in memory.
+        # The listing replaces the previous one only once it has been read to the end.
+        key = (account, region, service, ','.join(target_tags))
+        listing_id = uuid.uuid4().hex
+        try:
+            for position, resource in enumerate(resources):
+                self.db.execute('INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                    listing_id, position, resource.tagger_id, resource.arn, resource.type, resource.tag_string, resource.parent_id,
+                    json.dumps(resource.tags), resource.vpc_id, json.dumps(list(resource.subnet_ids))))
+                if position % INSERT_BATCH_SIZE == INSERT_BATCH_SIZE - 1:
+                    self.db.commit()
+                yield resource
+        except BaseException:
+            self.db.rollback()
+            self.db.execute('DELETE FROM resources WHERE listing_id = ?', (listing_id,))
+            self.db.commit()
+            raise
+        row = self.db.execute('SELECT listing_id FROM listings WHERE account = ? AND region = ? AND service = ? AND target_tags = ?', key).fetchone()
+        if row is not None:
+            self.db.execute('DELETE FROM resources WHERE listing_id = ?', (row[0],))
+        self.db.execute('INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?)', key + (listing_id, time.time()))
+        self.db.commit()
+
+    def load_tags(self, account, region, service):
+        # Returns {tagger_id: tags} saved within the TTL
+        rows = self.db.execute('SELECT tagger_id, tags FROM tags WHERE account = ? AND region = ? AND service = ? AND saved_at >= ?',
+                               (account, region, service, time.time() - self.ttl))
+        return {tagger_id: json.loads(tags) for tagger_id, tags in rows}
+
+    def save_tags(self, account, region, service, tag_map):
+        now = time.time()
+        self.db.executemany('INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?)',
+                            [(account, region, service, tagger_id, json.dumps(tags), now) for tagger_id, tags in tag_map.items()])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
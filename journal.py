@@ -0,0 +1,72 @@
+import json
+import os
+import time
+import uuid
+
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'service-tagger', 'journal.jsonl')
+# Seconds between two fsyncs of the journal, at most this much progress is lost when the machine goes down
+FSYNC_INTERVAL = 1
+# Resources waiting for new tags that a run that is not streamed writes at once, bounds the work an interrupted run loses
+CHECKPOINT_SIZE = 1000
+
+
+def new_run_id():
+    # Tells the entries of a run apart from the earlier runs of the same account, region, service and target tags in the journal
+    return uuid.uuid4().hex
+
+
+def load_committed(path, context):
+    # Returns (run id, ids of the resources it tagged) of the last run the journal has entries of for the account, region, service
+    # and target tags of the context, or (None, empty set). The journal is shared by every run, entries of other contexts are skipped.
+    # The last outcome of a resource wins, so a resource that failed after it had been tagged is written again.
+    last_run = None
+    # {run id: {tagger_id: outcome}}
+    outcomes = {}
+    try:
+        with open(path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line of a journal whose run was killed mid write
+                    continue
+                if all(entry.get(key) == value for key, value in context.items()):
+                    last_run = entry.get('run')
+                    outcomes.setdefault(last_run, {})[entry['id']] = entry['outcome']
+    except FileNotFoundError:
+        pass
+    return last_run, {tagger_id for tagger_id, outcome in outcomes.get(last_run, {}).items() if outcome == 'tagged'}
+
+
+class Journal:
+    # Append-only log of the outcome of every tag write. The entries of a batch go out in a single append so the regions and
+    # account processes writing to the same journal never interleave within a line, and the file is synced every FSYNC_INTERVAL.
+    # The journal is never truncated, every entry carries the context and run it belongs to.
+    def __init__(self, path, context, fsync_interval=FSYNC_INTERVAL):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Fields added to every entry, resuming only skips the entries of the same account, region, service, target tags and run
+        self.context = context
+        self.fsync_interval = fsync_interval
+        self.synced = time.monotonic()
+
+    def record(self, pending, failures):
+        # pending is {tagger_id: new_tags} of a tag write and failures {tagger_id: error message} of the resources it could not tag
+        lines = []
+        for tagger_id, new_tags in pending.items():
+            entry = {**self.context, 'id': tagger_id, 'tags': new_tags, 'outcome': 'failed' if tagger_id in failures else 'tagged'}
+            if tagger_id in failures:
+                entry['error'] = failures[tagger_id]
+            lines.append((json.dumps(entry, default=str) + '\n').encode())
+        os.write(self.fd, b''.join(lines))
+        if time.monotonic() - self.synced >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.fd)
+        self.synced = time.monotonic()
+
+    def close(self):
+        self.sync()
+        os.close(self.fd)
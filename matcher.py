@@ -0,0 +1,104 @@
+from collections import deque
+
+
+class AhoCorasick:
+    # Multi-pattern substring search: finds every pattern contained in a text in one pass over the text
+    # https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].add(index)
+
+        # Breadth first so the fail link of every parent is known before its children are visited
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text):
+        # Patterns ending at the root (empty strings) are contained in every text
+        found = set(self.output[0])
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found |= self.output[node]
+        return found
+
+
+class TagMatcher:
+    # Compiles the yaml config once into one automaton per target tag over all of the tag's arn_parts.
+    # match() keeps the semantics of checking every arn_part of every tag value in yaml order:
+    # the last tag value with an arn_part contained in the tag_string wins.
+    def __init__(self, tags_config, target_tags):
+        self.values = {}
+        self.automata = {}
+        self.patterns = {}
+        self.pattern_values = {}
+        self.warnings = []
+        for target_tag in target_tags:
+            if tags_config.get(target_tag) is None:
+                continue
+            values = []
+            patterns = []
+            pattern_values = []
+            for tag_value, arn_parts in tags_config[target_tag].items():
+                if arn_parts is None:
+                    self.warnings.append(f"The tag '{target_tag}'s value {tag_value} has no arn_parts in the yaml file.")
+                    continue
+                values.append(tag_value)
+                for arn_part in arn_parts:
+                    patterns.append(str(arn_part))
+                    pattern_values.append(len(values) - 1)
+            self.values[target_tag] = values
+            self.automata[target_tag] = AhoCorasick(patterns)
+            self.patterns[target_tag] = patterns
+            self.pattern_values[target_tag] = pattern_values
+
+    def has_values(self, target_tag):
+        return target_tag in self.automata
+
+    def match(self, target_tag, tag_string):
+        # Returns the tag value for the tag_string, or None if no arn_part matches
+        rule = self.match_rule(target_tag, tag_string)
+        return None if rule is None else rule[0]
+
+    def match_rule(self, target_tag, tag_string):
+        # Returns (tag value, arn_part) for the tag_string, where arn_part is the last arn_part of the winning value that matched.
+        # None if no arn_part matches.
+        found = self.automata[target_tag].search(tag_string)
+        if len(found) == 0:
+            return None
+        pattern_values = self.pattern_values[target_tag]
+        pattern = max(found, key=lambda pattern: (pattern_values[pattern], pattern))
+        return self.values[target_tag][pattern_values[pattern]], self.patterns[target_tag][pattern]
+
+
+def nested_loop_match(tags_config, target_tag, tag_string):
+    # The per-resource loop TagMatcher replaced, kept as the reference for its tests and the matcher benchmark:
+    # every arn_part of every tag value is checked in yaml order and the last tag value with a matching arn_part wins
+    new_value = None
+    for tag_value, arn_parts in tags_config[target_tag].items():
+        if arn_parts is None:
+            continue
+        for arn_part in sorted(arn_parts):
+            if arn_part in tag_string:
+                new_value = tag_value
+    return new_value
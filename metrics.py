@@ -0,0 +1,249 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+
+# Upper bounds in seconds of the API latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Prefix of every metric of the Prometheus textfile
+PROMETHEUS_PREFIX = 'service_tagger'
+
+
+def new_operation_stats(service, operation):
+    return {
+        'service': service,
+        'operation': operation,
+        'calls': 0,
+        'errors': 0,
+        'retries': 0,
+        'request_bytes': 0,
+        'response_bytes': 0,
+        'latency_sum': 0.0,
+        'latency_max': 0.0,
+        # Calls per LATENCY_BUCKETS bucket, not cumulative, plus one for the calls slower than the last bound
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    # Query protocol services (EC2, RDS, ...) keep the body as a dict until the request is sent form encoded
+    if isinstance(body, dict):
+        return len(urlencode(body))
+    # Streamed bodies are not read
+    return 0
+
+
+class Metrics:
+    # Counts, bytes, retries and latencies of every API call per service and operation, collected with botocore event hooks
+    # on every boto3 client a Client builds, and the wall time of named phases of the run (listing, classification, tag reads, ...).
+    # One Metrics per region like the RateLimiter, the stats of all regions and accounts are merged for the summary.
+    def __init__(self):
+        self.operations = {}
+        # {name: {'count': ..., 'seconds': ...}}, nested phases are counted in full by each of them
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def attach(self, client):
+        # Registered after the RateLimiter so the latency does not include the time a call waits for its rate limit
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/events.html
+        client.meta.events.register('before-call', self.before_call)
+        client.meta.events.register('after-call', self.after_call)
+        client.meta.events.register('after-call-error', self.after_call_error)
+        return client
+
+    def operation(self, model):
+        key = f'{model.service_model.service_name}.{model.name}'
+        with self.lock:
+            if key not in self.operations:
+                self.operations[key] = new_operation_stats(model.service_model.service_name, model.name)
+            return self.operations[key]
+
+    def before_call(self, model, params, context, **kwargs):
+        # The context dict is handed to every event of the same call
+        context['metrics_started'] = time.perf_counter()
+        context['metrics_request_bytes'] = body_size(params.get('body'))
+
+    def after_call(self, model, http_response, parsed, context, **kwargs):
+        response_bytes = 0
+        if http_response is not None:
+            if 'content-length' in http_response.headers:
+                response_bytes = int(http_response.headers['content-length'])
+            elif http_response.raw is not None and not model.has_streaming_output:
+                # Chunked responses have no content-length, their content has already been read for parsing.
+                # Stubbed responses have no raw response to read from
+                response_bytes = len(http_response.content or b'')
+        self.record(model, context, parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0), 'Error' in parsed, response_bytes)
+
+    def after_call_error(self, model, context, **kwargs):
+        # The call failed without a response, e.g. a connection error after all retries
+        self.record(model, context, 0, True, 0)
+
+    def record(self, model, context, retries, error, response_bytes):
+        latency = time.perf_counter() - context.get('metrics_started', time.perf_counter())
+        stats = self.operation(model)
+        bucket = next((index for index, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        with self.lock:
+            stats['calls'] += 1
+            stats['errors'] += 1 if error else 0
+            stats['retries'] += retries
+            stats['request_bytes'] += context.get('metrics_request_bytes', 0)
+            stats['response_bytes'] += response_bytes
+            stats['latency_sum'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            stats['buckets'][bucket] += 1
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            phase = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0})
+            phase['count'] += 1
+            phase['seconds'] += seconds
+
+    def stats(self):
+        # Plain dicts so the stats of account worker processes can be returned to the main process
+        with self.lock:
+            return {
+                'operations': {key: {**stats, 'buckets': list(stats['buckets'])} for key, stats in self.operations.items()},
+                'phases': {name: dict(phase) for name, phase in self.phases.items()},
+            }
+
+
+def timed(name):
+    # Decorator adding the wall time of a ServiceAdapter method to the phase name of its engine's metrics
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.engine.metrics.phase(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def merge_stats(all_stats):
+    merged = {'operations': {}, 'phases': {}}
+    for stats in all_stats:
+        for key, operation in stats['operations'].items():
+            total = merged['operations'].setdefault(key, new_operation_stats(operation['service'], operation['operation']))
+            for field in ('calls', 'errors', 'retries', 'request_bytes', 'response_bytes', 'latency_sum'):
+                total[field] += operation[field]
+            total['latency_max'] = max(total['latency_max'], operation['latency_max'])
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], operation['buckets'])]
+        for name, phase in stats['phases'].items():
+            total = merged['phases'].setdefault(name, {'count': 0, 'seconds': 0.0})
+            total['count'] += phase['count']
+            total['seconds'] += phase['seconds']
+    return merged
+
+
+def latency_quantile(operation, quantile):
+    # Upper bound of the histogram bucket the quantile falls in, capped at the slowest call
+    rank = quantile * operation['calls']
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, operation['buckets']):
+        seen += count
+        if seen >= rank:
+            return min(bound, operation['latency_max'])
+    return operation['latency_max']
+
+
+def summary_lines(stats):
+    # API calls sorted by their total latency, then the phases sorted by their wall time
+    lines = [f"{'API call':<45} {'calls':>7} {'errors':>6} {'retries':>7} {'KiB out':>9} {'KiB in':>9} {'total s':>9} {'avg ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+    for key, operation in sorted(stats['operations'].items(), key=lambda item: -item[1]['latency_sum']):
+        calls = max(operation['calls'], 1)
+        lines.append(
+            f"{key:<45} {operation['calls']:>7} {operation['errors']:>6} {operation['retries']:>7} "
+            f"{operation['request_bytes'] / 1024:>9.1f} {operation['response_bytes'] / 1024:>9.1f} {operation['latency_sum']:>9.2f} "
+            f"{operation['latency_sum'] / calls * 1000:>8.1f} {latency_quantile(operation, 0.5) * 1000:>8.0f} "
+            f"{latency_quantile(operation, 0.95) * 1000:>8.0f} {operation['latency_max'] * 1000:>8.0f}"
+        )
+    lines.append(f"{'Phase':<45} {'count':>7} {'total s':>9} {'avg ms':>8}")
+    for name, phase in sorted(stats['phases'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append(f"{name:<45} {phase['count']:>7} {phase['seconds']:>9.2f} {phase['seconds'] / max(phase['count'], 1) * 1000:>8.1f}")
+    return lines
+
+
+def write_json(path, stats, rate_limits=None):
+    # rate_limits is {scope: RateLimiter.stats()} of every region and account, the history of each API family included
+    with open(path, 'w') as file:
+        json.dump({**stats, 'rate_limits': rate_limits or {}, 'latency_buckets': LATENCY_BUCKETS}, file, indent=2)
+
+
+def prometheus_lines(stats, labels, rate_limits=None):
+    # Text exposition format for node_exporter's textfile collector, labels are added to every sample
+    # https://prometheus.io/docs/instrumenting/exposition_formats/
+    def label_string(extra):
+        return '{' + ','.join(f'{key}="{value}"' for key, value in {**labels, **extra}.items()) + '}'
+
+    lines = []
+    counters = [
+        ('api_calls_total', 'calls', 'API calls'),
+        ('api_errors_total', 'errors', 'API calls that returned an error'),
+        ('api_retries_total', 'retries', 'Attempts botocore retried'),
+        ('api_request_bytes_total', 'request_bytes', 'Bytes of the request bodies'),
+        ('api_response_bytes_total', 'response_bytes', 'Bytes of the response bodies'),
+    ]
+    for name, field, help_text in counters:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}.")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} counter")
+        for operation in stats['operations'].values():
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{label_string({'api_service': operation['service'], 'operation': operation['operation']})} {operation[field]}")
+
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_api_latency_seconds Latency of the API calls, retries included.")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_api_latency_seconds histogram")
+    for operation in stats['operations'].values():
+        operation_labels = {'api_service': operation['service'], 'operation': operation['operation']}
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], operation['buckets']):
+            cumulative += count
+            lines.append(f"{PROMETHEUS_PREFIX}_api_latency_seconds_bucket{label_string({**operation_labels, 'le': bound})} {cumulative}")
+        lines.append(f"{PROMETHEUS_PREFIX}_api_latency_seconds_sum{label_string(operation_labels)} {operation['latency_sum']}")
+        lines.append(f"{PROMETHEUS_PREFIX}_api_latency_seconds_count{label_string(operation_labels)} {operation['calls']}")
+
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_phase_seconds_total Wall time of the phases of the run.")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_phase_seconds_total counter")
+    for name, phase in stats['phases'].items():
+        lines.append(f"{PROMETHEUS_PREFIX}_phase_seconds_total{label_string({'phase': name})} {phase['seconds']}")
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_phase_runs_total Times the phases of the run were entered.")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_phase_runs_total counter")
+    for name, phase in stats['phases'].items():
+        lines.append(f"{PROMETHEUS_PREFIX}_phase_runs_total{label_string({'phase': name})} {phase['count']}")
+
+    # Rate limiter of each API family per region and account, the history only leaves the lowest rate throttling pushed it to
+    rate_limits = rate_limits or {}
+    samples = [
+        ('rate_limit_calls_total', 'counter', 'API calls that went through the rate limiter', lambda family: family['calls']),
+        ('rate_limit_throttles_total', 'counter', 'API calls AWS throttled', lambda family: family['throttles']),
+        ('rate_limit_retries_total', 'counter', 'Attempts botocore retried in the API family', lambda family: family['retries']),
+        ('rate_limit_rate', 'gauge', 'Calls per second the rate limiter allowed at the end of the run', lambda family: family['rate']),
+        ('rate_limit_min_rate', 'gauge', 'Lowest calls per second the rate limiter allowed during the run', lambda family: min([family['rate']] + [rate for _, rate, _ in family['history']])),
+        ('rate_limit_effective_rate', 'gauge', 'Calls per second the run made', lambda family: family['effective_rate']),
+    ]
+    for name, kind, help_text, value in samples:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}.")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        for scope, families in rate_limits.items():
+            for api_family, family in families.items():
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{label_string({'scope': scope, 'api_family': api_family})} {value(family)}")
+    return lines
+
+
+def write_prometheus(path, stats, labels, rate_limits=None):
+    # Written to a temporary file first so the textfile collector never reads a partial file
+    temporary_path = f'{path}.{os.getpid()}'
+    with open(temporary_path, 'w') as file:
+        file.write('\n'.join(prometheus_lines(stats, labels, rate_limits)) + '\n')
+    os.replace(temporary_path, path)
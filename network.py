@@ -0,0 +1,33 @@
+def get_vpc_names(ec2_client):
+    # Returns {vpc_id: name} for every VPC in the client's region, VPCs without a Name tag map to ""
+    vpc_names = {}
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeVpcs
+    for page in ec2_client.get_paginator('describe_vpcs').paginate():
+        for vpc in page['Vpcs']:
+            names = [tag['Value'] for tag in vpc.get('Tags', []) if tag['Key'].lower() == 'name']
+            vpc_names[vpc['VpcId']] = names[0] if len(names) > 0 else ""
+    return vpc_names
+
+
+def get_public_subnets(ec2_client):
+    # Returns {subnet_id: is_public} for every subnet in the client's region.
+    # A subnet is public when its route table has a route to an internet gateway. Subnets without an
+    # explicit route table association use the main route table of their VPC.
+    explicit = {}
+    main = {}
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeRouteTables
+    for page in ec2_client.get_paginator('describe_route_tables').paginate():
+        for table in page['RouteTables']:
+            public = any('GatewayId' in route.keys() and 'igw' in route['GatewayId'] for route in table['Routes'])
+            for association in table.get('Associations', []):
+                if association.get('Main'):
+                    main[table['VpcId']] = public
+                elif 'SubnetId' in association.keys():
+                    explicit[association['SubnetId']] = public
+    public_subnets = {}
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeSubnets
+    for page in ec2_client.get_paginator('describe_subnets').paginate():
+        for subnet in page['Subnets']:
+            subnet_id = subnet['SubnetId']
+            public_subnets[subnet_id] = explicit.get(subnet_id, main.get(subnet['VpcId'], False))
+    return public_subnets
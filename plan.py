@@ -0,0 +1,34 @@
+import json
+import time
+
+
+# Version of the plan file format, apply refuses plans it does not know
+PLAN_VERSION = 1
+
+
+def start_plan(path, service, target_tags, config_file):
+    # Writes the header line, the resources are appended by a ReportWriter per region as they are checked
+    with open(path, 'w') as file:
+        file.write(json.dumps({
+            'plan': PLAN_VERSION,
+            'service': service,
+            'target_tags': target_tags,
+            'config': config_file,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }) + '\n')
+
+
+def read_plan(path):
+    # Returns the header and a generator over the planned resources, so large plans are applied without loading them whole
+    file = open(path)
+    header = json.loads(file.readline())
+    if header.get('plan') != PLAN_VERSION:
+        file.close()
+        raise ValueError(f"{path} is not a plan file of version {PLAN_VERSION}")
+
+    def records():
+        with file:
+            for line in file:
+                if line.strip() != "":
+                    yield json.loads(line)
+    return header, records()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+# Error codes AWS returns when a caller exceeds an API rate limit, same list as botocore's standard retry mode
+THROTTLING_ERROR_CODES = [
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'RequestThrottled',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'EC2ThrottledException',
+]
+# Operations with these prefixes only read, AWS rate limits them separately from mutating calls
+READ_OPERATION_PREFIXES = ['Describe', 'List', 'Get', 'Head']
+
+# Calls per second each API family starts at and is allowed to grow to
+DEFAULT_RATE = 50.0
+MAX_RATE = 200.0
+MIN_RATE = 0.5
+# AIMD: every successful call raises the rate by ADDITIVE_INCREASE, a throttle multiplies it by MULTIPLICATIVE_DECREASE
+ADDITIVE_INCREASE = 0.5
+MULTIPLICATIVE_DECREASE = 0.5
+# Throttles of calls that were already in flight when the rate was cut should not cut it again
+DECREASE_COOLDOWN = 1.0
+# Seconds between two samples of the effective rate
+SAMPLE_INTERVAL = 1.0
+
+
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+def api_family(operation):
+    service = operation.service_model.service_name
+    if any(operation.name.startswith(prefix) for prefix in READ_OPERATION_PREFIXES):
+        return f'{service}:read'
+    return f'{service}:write'
+
+
+class TokenBucket:
+    def __init__(self, rate, max_rate):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.tokens = 1.0
+        self.lock = threading.Lock()
+        self.started = self.updated = self.last_decrease = self.last_sample = time.monotonic()
+        self.calls = 0
+        self.calls_since_sample = 0
+        self.throttles = 0
+        self.retries = 0
+        # (seconds since start, allowed rate, effective rate) samples
+        self.history = []
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            # Allow bursts of up to one second worth of calls
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Taking the token even when the bucket is empty reserves the next free slot for this caller
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.calls += 1
+            self.calls_since_sample += 1
+            self.sample(now)
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= DECREASE_COOLDOWN:
+                self.rate = max(MIN_RATE, self.rate * MULTIPLICATIVE_DECREASE)
+                self.tokens = min(self.tokens, 0)
+                self.last_decrease = now
+                self.sample(now, force=True)
+
+    def sample(self, now, force=False):
+        elapsed = now - self.last_sample
+        if elapsed >= SAMPLE_INTERVAL or (force and elapsed > 0):
+            self.history.append((round(now - self.started, 3), round(self.rate, 2), round(self.calls_since_sample / elapsed, 2)))
+            self.calls_since_sample = 0
+            self.last_sample = now
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'calls': self.calls,
+                'throttles': self.throttles,
+                'retries': self.retries,
+                'rate': round(self.rate, 2),
+                'effective_rate': round(self.calls / elapsed, 2) if elapsed > 0 else 0.0,
+                'history': list(self.history),
+            }
+
+
+class RateLimiter:
+    # Token bucket per API family ('ec2:read', 'rds:write', ...) shared by every boto3 client it is attached to.
+    # Buckets start at DEFAULT_RATE calls per second and adapt to the throttles AWS returns (AIMD).
+    def __init__(self, max_rate=MAX_RATE):
+        self.max_rate = max_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, family):
+        with self.lock:
+            if family not in self.buckets:
+                self.buckets[family] = TokenBucket(min(DEFAULT_RATE, self.max_rate), self.max_rate)
+            return self.buckets[family]
+
+    def attach(self, client):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/events.html
+        client.meta.events.register('before-call', self.before_call)
+        client.meta.events.register('needs-retry', self.needs_retry)
+        client.meta.events.register('after-call', self.after_call)
+        return client
+
+    def before_call(self, model, **kwargs):
+        self.bucket(api_family(model)).acquire()
+
+    def needs_retry(self, response, operation, **kwargs):
+        # Called after every HTTP attempt, including the ones botocore retries itself
+        if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            self.bucket(api_family(operation)).on_throttle()
+        # Returning None leaves the retry decision to botocore
+
+    def after_call(self, model, parsed, **kwargs):
+        bucket = self.bucket(api_family(model))
+        metadata = parsed.get('ResponseMetadata', {})
+        with bucket.lock:
+            bucket.retries += metadata.get('RetryAttempts', 0)
+        if 'Error' not in parsed:
+            bucket.on_success()
+        elif parsed['Error'].get('Code') in THROTTLING_ERROR_CODES and 'RetryAttempts' not in metadata:
+            # Responses that never went through botocore's retry loop (e.g. stubbed clients) were not seen by needs_retry
+            bucket.on_throttle()
+
+    def stats(self):
+        with self.lock:
+            families = sorted(self.buckets.items())
+        return {family: bucket.stats() for family, bucket in families}
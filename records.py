@@ -0,0 +1,22 @@
+class Resource:
+    # Compact record of a listed resource. Client.iter_resources projects every describe payload into one of these
+    # right away so the full boto response (block devices, network interfaces, ...) can be dropped.
+    __slots__ = ['tagger_id', 'arn', 'type', 'tag_string', 'parent_id', 'tags', 'vpc_id', 'subnet_ids']
+
+    def __init__(self, tagger_id, arn, type, tag_string, parent_id=None, tags=None, vpc_id=None, subnet_ids=()):
+        # Identifier the tags are read and written with, the bare resource id for some services and the ARN for others
+        self.tagger_id = tagger_id
+        self.arn = arn
+        # Resource type within the service, e.g. 'instance', 'volume' or 'snapshot' for EC2
+        self.type = type
+        # String the arn_parts of tag_config.yaml are matched against
+        self.tag_string = tag_string
+        # tagger_id of the cluster, instance or volume the resource belongs to
+        self.parent_id = parent_id
+        # {key: value} if the describe call already returned the resource's tags, None if they still have to be read
+        self.tags = tags
+        self.vpc_id = vpc_id
+        self.subnet_ids = subnet_ids
+
+    def __repr__(self):
+        return f'Resource({self.type} {self.tagger_id})'
@@ -0,0 +1,73 @@
+import json
+import os
+import time
+
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+DEBUG = LOG_LEVELS['debug']
+INFO = LOG_LEVELS['info']
+WARNING = LOG_LEVELS['warning']
+ERROR = LOG_LEVELS['error']
+# Bytes of report records collected before they are written to the file
+REPORT_BUFFER_SIZE = 256 * 1024
+# Seconds between two progress lines of a region
+PROGRESS_INTERVAL = 5
+
+
+def print_log(text, level=INFO):
+    # Log of a Client that is not given the log of a run, prints every line
+    print(text, flush=True)
+
+
+def truncate_report(path):
+    # Called once before any region or account worker appends to the report
+    with open(path, 'w'):
+        pass
+
+
+class ReportWriter:
+    # Appends one JSON line per record to the report file. Records are collected in memory and written in large chunks,
+    # every chunk holds whole lines and goes out in a single append so the regions and account processes writing to the
+    # same file never interleave within a line.
+    def __init__(self, path, context=None, buffer_size=REPORT_BUFFER_SIZE):
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Fields added to every record, e.g. the account, region and service
+        self.context = context or {}
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, record):
+        line = (json.dumps({**self.context, **record}, default=str) + '\n').encode()
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            os.write(self.fd, b''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        os.close(self.fd)
+
+
+class Progress:
+    # Tells when the next progress line of a region is due, so the console output of a run does not grow with its size
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last = self.started
+
+    def due(self):
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+    def rate(self, count):
+        return round(count / max(time.monotonic() - self.started, 0.001), 1)
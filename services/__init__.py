@@ -0,0 +1,28 @@
+import importlib
+
+
+# Module and class of the adapter of every supported service. Adapters are only imported once a Client of their service is created.
+ADAPTERS = {
+    'lambda': ('services.aws_lambda', 'LambdaAdapter'),
+    'cloudwatchlogs': ('services.cloudwatchlogs', 'CloudWatchLogsAdapter'),
+    'cloudfront': ('services.cloudfront', 'CloudFrontAdapter'),
+    's3': ('services.s3', 'S3Adapter'),
+    'rds': ('services.rds', 'RdsAdapter'),
+    'ec2': ('services.ec2', 'Ec2Adapter'),
+    'elasticache': ('services.elasticache', 'ElastiCacheAdapter'),
+    'efs': ('services.efs', 'EfsAdapter'),
+    'ecs': ('services.ecs', 'EcsAdapter'),
+    'dynamodb': ('services.dynamodb', 'DynamoDbAdapter'),
+    'opensearch': ('services.opensearch', 'OpenSearchAdapter'),
+    'ecr': ('services.ecr', 'EcrAdapter'),
+    'fsx': ('services.fsx', 'FsxAdapter'),
+}
+
+
+def is_supported(service):
+    return service in ADAPTERS
+
+
+def get_adapter_class(service):
+    module_name, class_name = ADAPTERS[service]
+    return getattr(importlib.import_module(module_name), class_name)
@@ -0,0 +1,29 @@
+from services.base import ServiceAdapter, TAGGING_API_BATCH_SIZE
+
+
+class LambdaAdapter(ServiceAdapter):
+    client_name = 'lambda'
+    sorted = True
+    tagging_api_writes = True
+    tag_batch_size = TAGGING_API_BATCH_SIZE
+    resource_types = ['function']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/lambda.html#Lambda.Paginator.ListFunctions
+        for page in self.client.get_paginator('list_functions').paginate():
+            for r in page.get('Functions'):
+                r['tagger_id'] = r['tag_string'] = r['FunctionArn']
+                if 'IsProduction' in target_tags:
+                    environment = self.engine.classifier.environment(
+                        'lambda:function',
+                        vpc_name=lambda: self.engine.get_vpc_name(r, "/VpcConfig/VpcId"),
+                        tags=lambda: self.engine.get_tags(r['FunctionArn']),
+                    )
+                    r['tag_string'] = r['FunctionArn'] + "-" + environment
+                yield self.project(r, 'function', r['FunctionArn'], vpc_id=r.get('VpcConfig', {}).get('VpcId'), subnet_ids=tuple(r.get('VpcConfig', {}).get('SubnetIds', [])))
+
+    def fetch_tags(self, tagger_id):
+        return self.client.list_tags(Resource=tagger_id).get('Tags', [])
+
+    def write_tags(self, tagger_id, new_tags):
+        self.client.tag_resource(Resource=tagger_id, Tags=new_tags)
@@ -0,0 +1,102 @@
+import threading
+from botocore.exceptions import ClientError, BotoCoreError
+
+import tagging_api
+from records import Resource
+
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/resourcegroupstaggingapi.html#ResourceGroupsTaggingAPI.Client.tag_resources
+TAGGING_API_BATCH_SIZE = 20
+
+
+def chunks(items, size):
+    # Yields lists of up to size items, items is read lazily so a streamed listing stays streamed
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+class ServiceAdapter:
+    # Everything Client does differently per service: listing the resources, reading and writing their tags and the limits of its APIs.
+    # The engine (a Client) keeps what all services share, e.g. the session, rate limiter, tag cache and VPC lookups.
+
+    # Name of the boto3 client of the service
+    client_name = None
+    # Resource types iter_resources lists, in listing order. --types selects a subset of them
+    resource_types = []
+    # Key the describe calls return tags under, resources without tags may omit it. None if the tags have to be read separately
+    describe_tag_key = None
+    # get_resources returns the resources sorted by tagger_id, otherwise they keep the order AWS lists them in
+    sorted = False
+    # Resources are listed the same from every region
+    global_service = False
+    # Largest number of resources a single tag write call accepts
+    tag_batch_size = 1
+    # tagger_id is an ARN the Resource Groups Tagging API can write to
+    tagging_api_writes = False
+    # The tagging API returns every tagged resource of the service, so a resource it does not return has no tags
+    bulk_tags_cover_all = True
+    # Most resources the service's APIs should be called for in parallel, None if only --concurrency limits it
+    max_concurrency = None
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.service_client = None
+
+    @property
+    def client(self):
+        # Built on first use and shared by every worker thread
+        if self.service_client is None:
+            with self.lock:
+                if self.service_client is None:
+                    self.service_client = self.engine.new_client(self.client_name)
+        return self.service_client
+
+    def project(self, r, resource_type, arn, parent_id=None, vpc_id=None, subnet_ids=()):
+        # Keeps only the fields used after classification, the describe payload is dropped once the record is built
+        tags = self.engine.tag_dict(r.get(self.describe_tag_key, [])) if self.describe_tag_key is not None else None
+        return Resource(r['tagger_id'], arn, resource_type, r['tag_string'], parent_id, tags, vpc_id, subnet_ids)
+
+    def iter_resources(self, target_tags):
+        # Yields a Resource record per resource while the service is still being listed
+        yield from ()
+
+    def fetch_tags(self, tagger_id):
+        return None
+
+    def load_tagged(self, target_tags):
+        # Returns {tagger_id: tags} of the resources that have every target tag, tags is None if only the target tags were read.
+        # The tagging API applies the tag filters on the server, so untagged resources are never transferred.
+        return tagging_api.get_tag_map(self.engine.get_tagging_client(), self.engine.service, target_tags, self.engine.types)
+
+    def write_tags(self, tagger_id, new_tags):
+        # Returns False if the tags were not written and the tag cache must not be updated
+        return None
+
+    def write_tag_batch(self, tagger_ids, new_tags):
+        # Returns {tagger_id: error message} for every resource that could not be tagged
+        failures = {}
+        if self.tagging_api_writes:
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/resourcegroupstaggingapi.html#ResourceGroupsTaggingAPI.Client.tag_resources
+            try:
+                response = self.engine.get_tagging_client().tag_resources(ResourceARNList=tagger_ids, Tags=new_tags)
+            except (BotoCoreError, ClientError) as e:
+                # The whole call failed, e.g. without the tag:TagResources permission, so none of its resources were tagged
+                return {tagger_id: str(e) for tagger_id in tagger_ids}
+            for arn, failure in response.get('FailedResourcesMap', {}).items():
+                failures[arn] = f"{failure.get('ErrorCode')}: {failure.get('ErrorMessage')}"
+            self.engine.update_cached_tags([tagger_id for tagger_id in tagger_ids if tagger_id not in failures], new_tags)
+        else:
+            # write_tags updates the tag cache itself
+            for tagger_id in tagger_ids:
+                try:
+                    self.engine.write_tags(tagger_id, new_tags)
+                except (BotoCoreError, ClientError) as e:
+                    failures[tagger_id] = str(e)
+        return failures
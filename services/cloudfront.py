@@ -0,0 +1,33 @@
+from services.base import ServiceAdapter
+
+
+class CloudFrontAdapter(ServiceAdapter):
+    client_name = 'cloudfront'
+    sorted = True
+    global_service = True
+    resource_types = ['distribution']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/cloudfront.html#CloudFront.Client.list_distributions
+        for page in self.client.get_paginator('list_distributions').paginate():
+            for r in page.get('DistributionList', {}).get('Items', []):
+                r['tagger_id'] = r['ARN']
+                r['tag_string'] = r['ARN']
+                yield self.project(r, 'distribution', r['ARN'])
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/cloudfront.html#CloudFront.Client.list_tags_for_resource
+        result = {}
+        for item in self.client.list_tags_for_resource(Resource=tagger_id).get('Tags', {}).get('Items', []):
+            result[item['Key']] = item['Value']
+        return result
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/cloudfront.html#CloudFront.Client.tag_resource
+        items = []
+        for key, value in new_tags.items():
+            items.append({
+                'Key': key,
+                'Value': value
+            })
+        self.client.tag_resource(Resource=tagger_id, Tags={'Items': items})
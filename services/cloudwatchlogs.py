@@ -0,0 +1,23 @@
+from services.base import ServiceAdapter
+
+
+class CloudWatchLogsAdapter(ServiceAdapter):
+    client_name = 'logs'
+    sorted = True
+    resource_types = ['log-group']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/logs.html#CloudWatchLogs.Paginator.DescribeLogGroups
+        for page in self.client.get_paginator('describe_log_groups').paginate():
+            for r in page.get('logGroups'):
+                r['tagger_id'] = r['logGroupName']
+                r['tag_string'] = r['logGroupName']
+                yield self.project(r, 'log-group', r.get('arn'))
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/logs.html#CloudWatchLogs.Client.list_tags_log_group
+        return self.client.list_tags_log_group(logGroupName=tagger_id).get('tags', [])
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/logs.html#CloudWatchLogs.Client.tag_log_group
+        self.client.tag_log_group(logGroupName=tagger_id, tags=new_tags)
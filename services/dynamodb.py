@@ -0,0 +1,28 @@
+from services.base import ServiceAdapter, TAGGING_API_BATCH_SIZE
+
+
+class DynamoDbAdapter(ServiceAdapter):
+    client_name = 'dynamodb'
+    tagging_api_writes = True
+    tag_batch_size = TAGGING_API_BATCH_SIZE
+    resource_types = ['table']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/efs.html#EFS.Paginator.DescribeFileSystems
+        for page in self.client.get_paginator('list_tables').paginate():
+            for tablename in page['TableNames']:
+                arn = f'arn:aws:dynamodb:{self.engine.region}:{self.engine.account.id}:table/{tablename}'
+                r = {'ARN': arn, 'Name': tablename}
+                r['tagger_id'] = r['tag_string'] = r['ARN']
+                if 'IsProduction' in target_tags:
+                    environment = self.engine.classifier.environment('dynamodb:table', tags=lambda: self.engine.get_tags(r['ARN']))
+                    r['tag_string'] = r['tag_string'] + environment
+                yield self.project(r, 'table', r['ARN'])
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb.html#DynamoDB.Client.list_tags_of_resource
+        return {tag['Key']:tag['Value'] for tag in self.client.list_tags_of_resource(ResourceArn=tagger_id).get('Tags', [])}
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/dynamodb.html#DynamoDB.Client.tag_resource
+        self.client.tag_resource(ResourceArn=tagger_id, Tags=[{"Key": key, "Value": new_tags[key]} for key in new_tags.keys()])
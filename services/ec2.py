@@ -0,0 +1,188 @@
+from botocore.exceptions import ClientError
+
+from metrics import timed
+from services.base import ServiceAdapter, chunks
+
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.create_tags
+EC2_TAG_BATCH_SIZE = 1000
+# Largest number of values a single describe filter accepts
+FILTER_VALUES_LIMIT = 200
+
+
+def is_invalid_id_error(error):
+    # create_tags rejects the whole batch with one of these codes if a single resource id does not exist or is malformed
+    # https://docs.aws.amazon.com/AWSEC2/latest/APIReference/errors-overview.html
+    code = error.response.get('Error', {}).get('Code', '')
+    return code == 'InvalidID' or (code.startswith('Invalid') and (code.endswith('.NotFound') or code.endswith('.Malformed')))
+
+
+class Ec2Adapter(ServiceAdapter):
+    client_name = 'ec2'
+    describe_tag_key = 'Tags'
+    tag_batch_size = EC2_TAG_BATCH_SIZE
+    resource_types = ['instance', 'volume', 'snapshot']
+
+    def iter_resources(self, target_tags):
+        # Join indexes from instance ids to their tag_string and from snapshot ids to the tag_string of the first volume created from them.
+        # If the parent type is not selected with --types, only the parents the selected resources reference are described.
+        self.instance_tag_strings = {}
+        self.volume_tag_strings = {}
+        self.loaded_parent_ids = set()
+        if self.engine.selected('instance'):
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeInstances
+            for instance in self.get_instances():
+                yield self.classify_instance(instance, target_tags)
+        if self.engine.selected('volume'):
+            for volumes in chunks(self.get_volumes(), FILTER_VALUES_LIMIT):
+                self.load_attached_instances(volumes, target_tags)
+                for volume in volumes:
+                    yield self.classify_volume(volume, target_tags)
+        if self.engine.selected('snapshot'):
+            for snapshots in chunks(self.get_snapshots(), FILTER_VALUES_LIMIT):
+                self.load_source_volumes(snapshots, target_tags)
+                for snapshot in snapshots:
+                    yield self.classify_snapshot(snapshot, target_tags)
+
+    @timed('classify instance')
+    def classify_instance(self, instance, target_tags):
+        instance['tagger_id'] = instance['tag_string'] = instance['InstanceId']
+        if 'IsProduction' in target_tags:
+            # Instances without tags have no Tags in the describe response
+            environment = self.engine.classifier.environment('ec2:instance', vpc_name=lambda: self.engine.get_vpc_name(instance), tags=instance.get('Tags', []))
+            instance['tag_string'] = f'{instance["tag_string"]}-{environment}'
+        if 'DataClassification' in target_tags:
+            if any(self.engine.subnet_is_public(interface['SubnetId']) for interface in instance['NetworkInterfaces']):
+                classification = "Public"
+            else:
+                classification = "Private"
+            instance['tag_string'] = f'{instance["tag_string"]}-{classification}'
+        self.instance_tag_strings[instance['InstanceId']] = instance['tag_string']
+        return self.project(instance, 'instance', f'arn:aws:ec2:{self.engine.region}:{self.engine.account.id}:instance/{instance["InstanceId"]}', vpc_id=instance.get('VpcId'), subnet_ids=tuple(interface['SubnetId'] for interface in instance['NetworkInterfaces']))
+
+    @timed('classify volume')
+    def classify_volume(self, volume, target_tags):
+        volume['tagger_id'] = volume['tag_string'] = volume['VolumeId']
+        if 'IsProduction' in target_tags:
+            attached_tag_strings = [self.instance_tag_strings[a['InstanceId']] for a in volume['Attachments'] if a['InstanceId'] in self.instance_tag_strings]
+            if len(attached_tag_strings) > 0:
+                if any('production' in tag_string for tag_string in attached_tag_strings):
+                    environment = "production"
+                else:
+                    environment = "development"
+            # Without tags the volume falls back to production like an untagged instance, the describe call omits Tags then
+            else:
+                environment = self.engine.classifier.environment('ec2:volume', tags=volume.get('Tags', []))
+            volume['tag_string'] = f"{volume['tag_string']}-{environment}"
+        self.volume_tag_strings.setdefault(volume['SnapshotId'], volume['tag_string'])
+        return self.project(volume, 'volume', f'arn:aws:ec2:{self.engine.region}:{self.engine.account.id}:volume/{volume["VolumeId"]}', parent_id=next((a['InstanceId'] for a in volume['Attachments']), None))
+
+    @timed('classify snapshot')
+    def classify_snapshot(self, snapshot, target_tags):
+        snapshot['tagger_id'] = snapshot['tag_string'] = snapshot['SnapshotId']
+        if "IsProduction" in target_tags:
+            if snapshot['SnapshotId'] in self.volume_tag_strings:
+                corrolated_tag_string = self.volume_tag_strings[snapshot['SnapshotId']]
+                if "production" in corrolated_tag_string:
+                    environment = "production"
+                elif "development" in corrolated_tag_string:
+                    environment = "development"
+            # Without tags the snapshot falls back to production like an untagged instance, the describe call omits Tags then
+            else:
+                environment = self.engine.classifier.environment('ec2:snapshot', tags=snapshot.get('Tags', []))
+            snapshot['tag_string'] = f'{snapshot["tag_string"]}-{environment}'
+        return self.project(snapshot, 'snapshot', f'arn:aws:ec2:{self.engine.region}::snapshot/{snapshot["SnapshotId"]}', parent_id=snapshot.get('VolumeId'))
+
+    @timed('load attached instances')
+    def load_attached_instances(self, volumes, target_tags):
+        # Only IsProduction of a volume depends on the instances it is attached to
+        if 'IsProduction' not in target_tags or self.engine.selected('instance'):
+            return
+        instance_ids = {a['InstanceId'] for volume in volumes for a in volume['Attachments']} - self.loaded_parent_ids
+        self.loaded_parent_ids.update(instance_ids)
+        for ids in chunks(sorted(instance_ids), FILTER_VALUES_LIMIT):
+            # The instance-id filter ignores ids of instances that no longer exist, unlike InstanceIds
+            for instance in self.get_instances([{'Name': 'instance-id', 'Values': ids}]):
+                self.classify_instance(instance, ['IsProduction'])
+
+    @timed('load source volumes')
+    def load_source_volumes(self, snapshots, target_tags):
+        # Only IsProduction of a snapshot depends on the volumes created from it
+        if 'IsProduction' not in target_tags or self.engine.selected('volume'):
+            return
+        snapshot_ids = {snapshot['SnapshotId'] for snapshot in snapshots} - self.loaded_parent_ids
+        self.loaded_parent_ids.update(snapshot_ids)
+        for ids in chunks(sorted(snapshot_ids), FILTER_VALUES_LIMIT):
+            volumes = list(self.get_volumes([{'Name': 'snapshot-id', 'Values': ids}]))
+            self.load_attached_instances(volumes, ['IsProduction'])
+            for volume in volumes:
+                self.classify_volume(volume, ['IsProduction'])
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.describe_tags
+        result = {}
+        for item in self.client.describe_tags(
+            Filters=[
+                {
+                    'Name': 'resource-id',
+                    'Values': [
+                        tagger_id,
+                    ],
+                },
+                ],
+            )['Tags']:
+            result[item['Key']] = item['Value']
+        return result
+
+    def load_tagged(self, target_tags):
+        # describe_tags filters on the tag key, so only the target tags of the resources that have them are returned
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeTags
+        tagged_ids = None
+        for target_tag in target_tags:
+            ids = set()
+            for page in self.client.get_paginator('describe_tags').paginate(Filters=[
+                {'Name': 'key', 'Values': [target_tag]},
+                {'Name': 'resource-type', 'Values': [resource_type for resource_type in self.resource_types if self.engine.selected(resource_type)]},
+            ]):
+                for tag in page['Tags']:
+                    ids.add(tag['ResourceId'])
+            tagged_ids = ids if tagged_ids is None else tagged_ids & ids
+        return {tagger_id: None for tagger_id in tagged_ids or ()}
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.create_tags
+        tags = [{"Key" : key, "Value": new_tags[key]} for key in new_tags.keys()]
+        self.client.create_tags(Resources=[tagger_id], Tags=tags)
+
+    def write_tag_batch(self, tagger_ids, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.create_tags
+        failures = {}
+        try:
+            self.client.create_tags(Resources=tagger_ids, Tags=[{"Key": key, "Value": new_tags[key]} for key in new_tags.keys()])
+        except ClientError as e:
+            if len(tagger_ids) > 1 and is_invalid_id_error(e):
+                # create_tags rejects the whole batch if a single resource is invalid, so retry one by one to find it
+                for tagger_id in tagger_ids:
+                    failures.update(self.write_tag_batch([tagger_id], new_tags))
+            else:
+                # Any other error (throttling, missing permissions, expired credentials, ...) fails every id of the batch alike
+                for tagger_id in tagger_ids:
+                    failures[tagger_id] = str(e)
+        self.engine.update_cached_tags([tagger_id for tagger_id in tagger_ids if tagger_id not in failures], new_tags)
+        return failures
+
+    def get_instances(self, filters=()):
+        for page in self.client.get_paginator('describe_instances').paginate(Filters=list(filters)):
+            for reservation in page.get('Reservations', []):
+                for instance in reservation['Instances']:
+                    yield instance
+
+    def get_volumes(self, filters=()):
+        for page in self.client.get_paginator('describe_volumes').paginate(Filters=list(filters)):
+            for volume in page['Volumes']:
+                yield volume
+
+    def get_snapshots(self):
+        for page in self.client.get_paginator('describe_snapshots').paginate(OwnerIds=[self.engine.account.id]):
+            for snapshot in page['Snapshots']:
+                yield snapshot
@@ -0,0 +1,28 @@
+from services.base import ServiceAdapter, TAGGING_API_BATCH_SIZE
+
+
+class EcrAdapter(ServiceAdapter):
+    client_name = 'ecr'
+    tagging_api_writes = True
+    tag_batch_size = TAGGING_API_BATCH_SIZE
+    resource_types = ['repository']
+
+    def iter_resources(self, target_tags):
+        for page in self.client.get_paginator('describe_repositories').paginate():
+            for repository in page['repositories']:
+                repository['tagger_id'] = repository['tag_string'] = repository['repositoryArn']
+                if 'IsProduction' in target_tags:
+                    environment = self.engine.classifier.environment(
+                        'ecr:repository',
+                        name=repository['repositoryName'],
+                        tags=lambda: self.engine.get_tags(repository['tagger_id']),
+                    )
+                    repository['tag_string'] = f'{repository["tag_string"]}-{environment}'
+                yield self.project(repository, 'repository', repository['repositoryArn'])
+
+    def fetch_tags(self, tagger_id):
+        return {tag['Key']:tag['Value'] for tag in self.client.list_tags_for_resource(resourceArn=tagger_id).get('tags', [])}
+
+    def write_tags(self, tagger_id, new_tags):
+        tags = [{"Key": key, "Value": new_tags[key]} for key in new_tags.keys()]
+        self.client.tag_resource(resourceArn=tagger_id, tags=tags)
@@ -0,0 +1,98 @@
+from botocore.exceptions import ClientError
+
+from ratelimit import is_throttling_error
+from report import WARNING
+from services.base import ServiceAdapter, TAGGING_API_BATCH_SIZE
+
+
+class EcsAdapter(ServiceAdapter):
+    client_name = 'ecs'
+    describe_tag_key = 'tags'
+    tagging_api_writes = True
+    tag_batch_size = TAGGING_API_BATCH_SIZE
+    resource_types = ['cluster', 'service', 'task']
+
+    def iter_resources(self, target_tags):
+        # Getting ECS clusters
+        clusters = self.get_ecs_clusters()
+        # Getting cluster arns for use in fetching services and tasks
+        cluster_arns = [cluster['clusterArn'] for cluster in clusters]
+        # Join index from cluster arns to their tag_string for correlating services and tasks with their cluster
+        cluster_tag_strings = {}
+
+        # Iterate through clusters first, and then tagging decisions for tasks and services will be based on the decision made for its cluster.
+        # Clusters are classified even if --types does not select them, services and tasks can only be listed per cluster anyway.
+        for cluster in clusters:
+            cluster['tagger_id'] = cluster['tag_string'] = cluster['clusterArn']
+            if 'IsProduction' in target_tags:
+                environment = self.engine.classifier.environment('ecs:cluster', name=cluster['clusterName'], tags=cluster.get('tags', []))
+                cluster['tag_string'] = cluster['tag_string'] + '-' + environment
+            cluster_tag_strings[cluster['clusterArn']] = cluster['tag_string']
+            if self.engine.selected('cluster'):
+                yield self.project(cluster, 'cluster', cluster['clusterArn'])
+
+        # Getting ECS services for each cluster
+        if self.engine.selected('service'):
+            for service in self.get_ecs_services(cluster_arns):
+                service['tagger_id'] = service['tag_string'] = service['serviceArn']
+                 # For each service, check the environment of the corrolated cluster
+                if 'IsProduction' in target_tags:
+                    if 'production' in cluster_tag_strings[service['clusterArn']]:
+                        environment = 'production'
+                    else:
+                        environment = 'development'
+                    service['tag_string'] = service['tag_string'] + '-' + environment
+                yield self.project(service, 'service', service['serviceArn'], parent_id=service['clusterArn'])
+
+        # Getting ECS tasks for each cluster
+        if self.engine.selected('task'):
+            for task in self.get_ecs_tasks(cluster_arns):
+                task['tag_string'] = task['tagger_id'] = task['taskArn']
+                # For each task, check the environment of the corrolated cluster
+                if 'IsProduction' in target_tags:
+                    if 'production' in cluster_tag_strings[task['clusterArn']]:
+                        environment = 'production'
+                    else:
+                        environment = 'development'
+                    task['tag_string'] = task['tag_string'] + '-' + environment
+                yield self.project(task, 'task', task['taskArn'], parent_id=task['clusterArn'])
+
+    def fetch_tags(self, tagger_id):
+        try:
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecs.html#ECS.Client.list_tags_for_resource
+            return {tag['key']:tag['value'] for tag in self.client.list_tags_for_resource(resourceArn=tagger_id).get('tags', [])}
+        except self.client.exceptions.InvalidParameterException as e:
+            self.engine.log(f"Failed to list tags for resource: {tagger_id}\nThis is likely due to the short arn format:\n{e}", WARNING)
+            return []
+
+    def write_tags(self, tagger_id, new_tags):
+        try:
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecs.html#ECS.Client.tag_resource
+            tags = [{"key" : key, "value": new_tags[key]} for key in new_tags.keys()]
+            self.client.tag_resource(resourceArn=tagger_id, tags=tags)
+        except ClientError as e:
+            if is_throttling_error(e):
+                raise
+            with open("error.log", 'a') as f:
+                f.write("Failed to apply tags for resource: " + tagger_id + "\nThis is likely due to a mismatching ARN format\n")
+            return False
+
+    def get_ecs_clusters(self):
+        cluster_arns = []
+        for page in self.client.get_paginator('list_clusters').paginate():
+            for arn in page['clusterArns']:
+                cluster_arns.append(arn)
+        clusters = self.client.describe_clusters(clusters=cluster_arns, include=['TAGS'])
+        return clusters['clusters']
+
+    def get_ecs_services(self, cluster_arns):
+        for arn in cluster_arns:
+            for page in self.client.get_paginator('list_services').paginate(cluster=arn):
+                if len(page.get('serviceArns')) > 0:
+                    yield from self.client.describe_services(cluster=arn, services=page.get('serviceArns'), include=['TAGS'])['services']
+
+    def get_ecs_tasks(self, cluster_arns):
+        for arn in cluster_arns:
+            for page in self.client.get_paginator('list_tasks').paginate(cluster=arn):
+                if len(page.get('taskArns')) > 0:
+                    yield from self.client.describe_tasks(tasks=page.get('taskArns'), cluster=arn, include=['TAGS'])['tasks']
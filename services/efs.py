@@ -0,0 +1,27 @@
+from services.base import ServiceAdapter
+
+
+class EfsAdapter(ServiceAdapter):
+    client_name = 'efs'
+    sorted = True
+    describe_tag_key = 'Tags'
+    resource_types = ['file-system']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/efs.html#EFS.Paginator.DescribeFileSystems
+        for page in self.client.get_paginator('describe_file_systems').paginate():
+            for r in page.get('FileSystems'):
+                r['tagger_id'] = r['tag_string'] = r['FileSystemId']
+                if 'IsProduction' in target_tags:
+                    environment = self.engine.classifier.environment('efs:file-system', tags=r.get('Tags', []))
+                    r['tag_string'] = r['FileSystemId'] + "-" + environment
+                yield self.project(r, 'file-system', r.get('FileSystemArn'))
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/efs.html#EFS.Client.describe_tags
+        return {tag['Key']:tag['Value'] for tag in self.client.list_tags_for_resource(ResourceId=tagger_id).get('Tags', [])}
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/efs.html#EFS.Client.tag_resource
+        tags = [{"Key" : key, "Value": new_tags[key]} for key in new_tags.keys()]
+        self.client.tag_resource(ResourceId=tagger_id, Tags=tags)
@@ -0,0 +1,23 @@
+from services.base import ServiceAdapter
+
+
+class ElastiCacheAdapter(ServiceAdapter):
+    client_name = 'elasticache'
+    sorted = True
+    resource_types = ['cluster']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Paginator.DescribeInstances
+        for page in self.client.get_paginator('describe_cache_clusters').paginate():
+            for r in page.get('CacheClusters'):
+                r['tagger_id'] = r['ARN']
+                r['tag_string'] = r['ARN']
+                yield self.project(r, 'cluster', r['ARN'])
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ec2.html#EC2.Client.describe_tags
+        return self.client.list_tags_for_resource(ResourceName=tagger_id).get('TagList', [])
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/elasticache.html#ElastiCache.Client.add_tags_to_resource
+        self.client.add_tags_to_resource(ResourceName=tagger_id, Tags=[{'Key':'string','Value':'string'}])
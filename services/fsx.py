@@ -0,0 +1,6 @@
+from services.base import ServiceAdapter
+
+
+class FsxAdapter(ServiceAdapter):
+    client_name = 'fsx'
+    resource_types = ['file-system']
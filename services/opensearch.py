@@ -0,0 +1,15 @@
+from services.base import ServiceAdapter
+
+
+class OpenSearchAdapter(ServiceAdapter):
+    client_name = 'opensearch'
+    sorted = True
+    resource_types = ['domain']
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/efs.html#EFS.Paginator.DescribeFileSystems
+        for page in self.client.describe_domain(self.engine.name):
+            for r in page.get('DomainStatus'):
+                r['tagger_id'] = r['DomainName']
+                r['tag_string'] = r['DomainName']
+                yield self.project(r, 'domain', r.get('ARN'), vpc_id=r.get('VPCOptions', {}).get('VPCId'), subnet_ids=tuple(r.get('VPCOptions', {}).get('SubnetIds', [])))
@@ -0,0 +1,151 @@
+from metrics import timed
+from services.base import ServiceAdapter, TAGGING_API_BATCH_SIZE, chunks
+
+
+# Number of identifiers passed to a single describe filter
+FILTER_VALUES_LIMIT = 100
+
+
+class RdsAdapter(ServiceAdapter):
+    client_name = 'rds'
+    describe_tag_key = 'TagList'
+    tagging_api_writes = True
+    tag_batch_size = TAGGING_API_BATCH_SIZE
+    resource_types = ['cluster', 'db', 'cluster-snapshot', 'snapshot']
+
+    def iter_resources(self, target_tags):
+        # Clusters are listed first since instances and cluster snapshots are classified from their cluster
+        # Join indexes from cluster and instance identifiers to their tag_string.
+        # If the parent type is not selected with --types, only the parents the selected resources reference are described.
+        self.cluster_tag_strings = {}
+        self.instance_tag_strings = {}
+        self.loaded_parent_ids = set()
+        if self.engine.selected('cluster'):
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Paginator.DescribeDBClusters
+            for page in self.client.get_paginator('describe_db_clusters').paginate():
+                for cluster in page.get('DBClusters'):
+                    yield self.classify_cluster(cluster, target_tags)
+        if self.engine.selected('db'):
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Paginator.DescribeDBInstances
+            for page in self.client.get_paginator('describe_db_instances').paginate():
+                self.load_clusters(page.get('DBInstances'), target_tags)
+                for instance in page.get('DBInstances'):
+                    yield self.classify_instance(instance, target_tags)
+        if self.engine.selected('cluster-snapshot'):
+            # Snapshot ARNs can have either :snapshot: or :cluster-snapshot: in the ARN, we are covering both use cases. Cloudability seems to be reporting only tags for cluster snapshots
+            for page in self.client.get_paginator('describe_db_cluster_snapshots').paginate():
+                for cluster_snapshot in page.get('DBClusterSnapshots'):
+                    yield self.classify_cluster_snapshot(cluster_snapshot, target_tags)
+        if self.engine.selected('snapshot'):
+            # Below is instance snapshots which are not being tracked by Cloudability
+            for page in self.client.get_paginator('describe_db_snapshots').paginate():
+                self.load_instances(page.get('DBSnapshots'), target_tags)
+                for snapshot in page.get('DBSnapshots'):
+                    yield self.classify_snapshot(snapshot, target_tags)
+
+    @timed('classify cluster')
+    def classify_cluster(self, cluster, target_tags):
+        cluster['tagger_id'] = cluster['tag_string'] = f'arn:aws:rds:{self.engine.region}:{self.engine.account.id}:cluster:{cluster["DBClusterIdentifier"]}'
+        if 'IsProduction' in target_tags:
+            environment = self.engine.classifier.environment('rds:cluster', tags=cluster.get('TagList', []))
+            cluster['tag_string'] = cluster['tag_string'] + environment
+        self.cluster_tag_strings[cluster['DBClusterIdentifier']] = cluster['tag_string']
+        return self.project(cluster, 'cluster', cluster.get('DBClusterArn'))
+
+    @timed('classify db')
+    def classify_instance(self, instance, target_tags):
+        instance['tagger_id'] = instance['tag_string'] = f'arn:aws:rds:{self.engine.region}:{self.engine.account.id}:db:{instance["DBInstanceIdentifier"]}'
+        if 'IsProduction' in target_tags:
+            if 'DBClusterIdentifier' in instance.keys():
+                if 'production' in self.cluster_tag_strings[instance['DBClusterIdentifier']]:
+                    environment = "production"
+                else:
+                    environment = "development"
+            else:
+                environment = self.engine.classifier.environment(
+                    'rds:db',
+                    vpc_name=lambda: self.engine.get_vpc_name(instance, "/DBSubnetGroup/VpcId"),
+                    tags=instance.get('TagList', []),
+                )
+            instance['tag_string'] = instance['tag_string'] + environment
+        self.instance_tag_strings[instance['DBInstanceIdentifier']] = instance['tag_string']
+        return self.project(instance, 'db', instance.get('DBInstanceArn'), parent_id=instance.get('DBClusterIdentifier'), vpc_id=instance.get('DBSubnetGroup', {}).get('VpcId'))
+
+    @timed('classify cluster-snapshot')
+    def classify_cluster_snapshot(self, cluster_snapshot, target_tags):
+        cluster_snapshot['tagger_id'] = cluster_snapshot['tag_string'] = cluster_snapshot["DBClusterSnapshotArn"]
+        # print(f"{cluster_snapshot['tagger_id']}")
+        if 'IsProduction' in target_tags:
+            # Snapshots of a DB cluster that no longer exists are classified on their own
+            if 'DBInstanceIdentifier' in cluster_snapshot.keys() and cluster_snapshot.get('DBClusterIdentifier') in self.cluster_tag_strings:
+                if 'production' in self.cluster_tag_strings[cluster_snapshot['DBClusterIdentifier']]:
+                    environment = "production"
+                else:
+                    environment = "development"
+            else:
+                environment = self.engine.classifier.environment(
+                    'rds:cluster-snapshot',
+                    vpc_name=lambda: self.engine.get_vpc_name(cluster_snapshot, "/DBSubnetGroup/VpcId"),
+                    tags=cluster_snapshot.get('TagList', []),
+                )
+            cluster_snapshot['tag_string'] = cluster_snapshot['tag_string'] + environment
+        return self.project(cluster_snapshot, 'cluster-snapshot', cluster_snapshot['DBClusterSnapshotArn'], parent_id=cluster_snapshot.get('DBClusterIdentifier'), vpc_id=cluster_snapshot.get('VpcId'))
+
+    @timed('classify snapshot')
+    def classify_snapshot(self, snapshot, target_tags):
+        snapshot['tagger_id'] = snapshot['tag_string'] = snapshot["DBSnapshotArn"]
+        # print(f"{snapshot['tagger_id']}")
+        if 'IsProduction' in target_tags:
+            # Snapshots of a DB instance that no longer exists are classified on their own
+            if snapshot.get('DBInstanceIdentifier') in self.instance_tag_strings:
+                if 'production' in self.instance_tag_strings[snapshot['DBInstanceIdentifier']]:
+                    environment = "production"
+                else:
+                    environment = "development"
+            else:
+                environment = self.engine.classifier.environment(
+                    'rds:snapshot',
+                    vpc_name=lambda: self.engine.get_vpc_name(snapshot, "/DBSubnetGroup/VpcId"),
+                    tags=snapshot.get('TagList', []),
+                )
+            snapshot['tag_string'] = snapshot['tag_string'] + environment
+        return self.project(snapshot, 'snapshot', snapshot['DBSnapshotArn'], parent_id=snapshot.get('DBInstanceIdentifier'), vpc_id=snapshot.get('VpcId'))
+
+    @timed('load parent clusters')
+    def load_clusters(self, instances, target_tags):
+        # Only IsProduction of an instance depends on its cluster
+        if 'IsProduction' not in target_tags or self.engine.selected('cluster'):
+            return
+        cluster_ids = {instance['DBClusterIdentifier'] for instance in instances if 'DBClusterIdentifier' in instance.keys()} - self.loaded_parent_ids
+        self.loaded_parent_ids.update(cluster_ids)
+        for ids in chunks(sorted(cluster_ids), FILTER_VALUES_LIMIT):
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Paginator.DescribeDBClusters
+            for page in self.client.get_paginator('describe_db_clusters').paginate(Filters=[{'Name': 'db-cluster-id', 'Values': ids}]):
+                for cluster in page.get('DBClusters'):
+                    self.classify_cluster(cluster, ['IsProduction'])
+
+    @timed('load parent instances')
+    def load_instances(self, snapshots, target_tags):
+        # Only IsProduction of a snapshot depends on its instance
+        if 'IsProduction' not in target_tags or self.engine.selected('db'):
+            return
+        instance_ids = {snapshot['DBInstanceIdentifier'] for snapshot in snapshots if 'DBInstanceIdentifier' in snapshot.keys()} - self.loaded_parent_ids
+        self.loaded_parent_ids.update(instance_ids)
+        for ids in chunks(sorted(instance_ids), FILTER_VALUES_LIMIT):
+            # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Paginator.DescribeDBInstances
+            for page in self.client.get_paginator('describe_db_instances').paginate(Filters=[{'Name': 'db-instance-id', 'Values': ids}]):
+                self.load_clusters(page.get('DBInstances'), ['IsProduction'])
+                for instance in page.get('DBInstances'):
+                    self.classify_instance(instance, ['IsProduction'])
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Client.list_tags_for_resource
+        result = {}
+        for item in self.client.list_tags_for_resource(ResourceName=tagger_id).get('TagList', []):
+            result[item['Key']] = item['Value']
+        return result
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/rds.html#RDS.Client.add_tags_to_resource
+         tags = [{"Key": key, "Value": new_tags[key]} for key in new_tags.keys()]
+         self.client.add_tags_to_resource(ResourceName=tagger_id, Tags=tags)
@@ -0,0 +1,138 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+from metrics import timed
+from ratelimit import is_throttling_error
+from report import WARNING
+from services.base import ServiceAdapter
+
+
+class S3Adapter(ServiceAdapter):
+    client_name = 's3'
+    global_service = True
+    resource_types = ['bucket']
+    # Buckets are listed across all regions but the tagging API only returns the buckets of the Client's region
+    bulk_tags_cover_all = False
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        # Pooled clients of the other regions buckets are in, see get_s3_client
+        self.s3_clients = {}
+        self.bucket_regions = {}
+
+    def iter_resources(self, target_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.list_buckets
+        buckets = self.client.list_buckets()['Buckets']
+        # Each bucket needs up to four sequential calls, so buckets are classified in parallel and yielded in bucket order.
+        # At most concurrency * 2 buckets are classified ahead of the caller, so a streamed run does not hold every classified bucket.
+        with ThreadPoolExecutor(max_workers=self.engine.concurrency) as executor:
+            window = deque()
+            for bucket in buckets:
+                window.append(executor.submit(self.classify_bucket, bucket, target_tags))
+                if len(window) >= self.engine.concurrency * 2:
+                    yield from self.project_bucket(window.popleft().result())
+            while window:
+                yield from self.project_bucket(window.popleft().result())
+
+    def project_bucket(self, bucket_resources):
+        for r in bucket_resources:
+            r['tagger_id'] = r['Name']
+            r['tag_string'] = r['Access'] if 'Access' in r.keys() else r['ARN']
+            yield self.project(r, 'bucket', f"arn:aws:s3:::{r['Name']}")
+
+    def fetch_tags(self, tagger_id):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.get_bucket_tagging
+        result = {}
+        try:
+            for item in self.get_s3_client(tagger_id).get_bucket_tagging(Bucket=tagger_id).get('TagSet'):
+                result[item['Key']] = item['Value']
+        except ClientError as e:
+            # Buckets without tags raise NoSuchTagSet, anything else means the tags are unknown
+            if e.response['Error']['Code'] != 'NoSuchTagSet':
+                raise
+        return result
+
+    def write_tags(self, tagger_id, new_tags):
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.html#S3.Client.get_bucket_tagging
+        # put_bucket_tagging replaces the whole tag set, so the write keeps the current tags of the bucket.
+        # Tags read from the bucket in this run are current, tags of the inventory cache or the tagging API are read again.
+        current_tags = self.engine.live_tags(tagger_id)
+        if current_tags is None:
+            current_tags = self.fetch_tags(tagger_id)
+        new_tags = {**current_tags, **new_tags}
+        response = self.get_s3_client(tagger_id).put_bucket_tagging(Bucket=tagger_id,
+                Tagging={
+                    'TagSet': [{'Key': str(k), 'Value': str(v)} for k, v in new_tags.items()]
+                }
+            )
+
+    @timed('classify bucket')
+    def classify_bucket(self, bucket, target_tags):
+        # Returns the resources get_resources keeps for a bucket: one carrying its access for DataClassification
+        # and one carrying its environment in the ARN
+        name = bucket['Name']
+        # Newer list_buckets responses include the bucket region, which saves the redirect of every call to buckets outside self.engine.region
+        if 'BucketRegion' in bucket.keys():
+            self.bucket_regions[name] = bucket['BucketRegion']
+        # Buckets that already have every target tag are skipped by --missing-only, so their policy, ACL and tags are not read
+        if self.engine.is_tagged(name):
+            return [{'Name': name, 'ARN': f'arn:aws:s3:::{name}'}]
+        resources = []
+        if 'DataClassification' in target_tags:
+            access = "Public" if self.bucket_is_public(name) else "Private"
+            resources.append({'Name': name, 'Access': access})
+        if 'IsProduction' in target_tags:
+            try:
+                environment = self.engine.classifier.environment('s3:bucket', name=name, tags=lambda: self.engine.get_tags(name))
+                arn = f'arn:aws:s3:::{name}-{environment}'
+            except ClientError as e:
+                if is_throttling_error(e):
+                    raise
+                # The bucket gets no environment, checking it reads its tags again and reports it as failed
+                arn = f'arn:aws:s3:::{name}'
+        else:
+            arn = f'arn:aws:s3:::{name}'
+        resources.append({'Name': name, 'ARN': arn})
+        return resources
+
+    @timed('s3 public access check')
+    def bucket_is_public(self, name):
+        # https://stackoverflow.com/questions/59002558/boto-find-if-bucket-is-public-or-private
+        client = self.get_s3_client(name)
+        try:
+            return client.get_bucket_policy_status(Bucket=name)['PolicyStatus']['IsPublic']
+        except ClientError as e:
+            if is_throttling_error(e):
+                raise
+            elif e.response['Error']['Code'] != 'NoSuchBucketPolicy':
+                self.engine.log(f"Unexpected error reading the policy status of bucket {name}, checking its public access block: {e}", WARNING)
+        # Without a bucket policy the public access block decides
+        try:
+            configuration = client.get_public_access_block(Bucket=name)['PublicAccessBlockConfiguration']
+            return not (configuration['BlockPublicAcls'] and configuration['BlockPublicPolicy'])
+        except ClientError as e:
+            if is_throttling_error(e):
+                raise
+            elif e.response['Error']['Code'] != 'NoSuchPublicAccessBlockConfiguration':
+                self.engine.log(f"Unexpected error reading the public access block of bucket {name}, assuming it is private: {e}", WARNING)
+                return False
+        # The bucket has no public access block configured, so only its ACL can still make it public
+        try:
+            grants = client.get_bucket_acl(Bucket=name)['Grants']
+            return any(self.engine.substring_in_string(["AllUsers","AuthenticatedUsers"], grant['Grantee']['URI']) for grant in grants if 'URI' in grant['Grantee'].keys())
+        except ClientError as e:
+            if is_throttling_error(e):
+                raise
+            self.engine.log(f"Unexpected error reading the ACL of bucket {name}, assuming it is private: {e}", WARNING)
+            return False
+
+    def get_s3_client(self, bucket_name):
+        # One pooled client per bucket region, buckets with an unknown region use the client of self.engine.region
+        region = self.bucket_regions.get(bucket_name, self.engine.region)
+        if region == self.engine.region:
+            return self.client
+        with self.lock:
+            if region not in self.s3_clients:
+                self.s3_clients[region] = self.engine.new_client('s3', region)
+            return self.s3_clients[region]
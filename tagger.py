@@ -1,73 +1,582 @@
 import argparse
+import os
+import sys
+import threading
+import time
+import boto3
 import yaml
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from client import Client
+from account import AccountContext, assume_role_session, get_regions
+import services
+from client import Client, TAGS_INVENTORY
+from inventory_cache import InventoryCache, DEFAULT_CACHE_PATH, DEFAULT_TTL
+from journal import Journal, CHECKPOINT_SIZE, DEFAULT_JOURNAL_PATH, load_committed, new_run_id
+from matcher import TagMatcher
+from metrics import Metrics, merge_stats, summary_lines, write_json, write_prometheus
+from plan import start_plan, read_plan
+from ratelimit import RateLimiter, MAX_RATE, is_throttling_error
+from report import LOG_LEVELS, DEBUG, INFO, WARNING, ERROR, Progress, ReportWriter, truncate_report
 
-parser = argparse.ArgumentParser()
-parser.add_argument("service", help="Specify which AWS service to use. Currently supported: lambda, cloudwatchlogs, cloudfront")
+parser = argparse.ArgumentParser(
+    usage="%(prog)s [plan] service tags [options]\n       %(prog)s apply plan [options]",
+    epilog="plan checks the resources like --write --dry-run and saves the tags it would write to --plan-file, apply writes the tags of a plan without listing the resources again.",
+)
+parser.add_argument("service", help=f"Specify which AWS service to use. Currently supported: {', '.join(services.ADAPTERS)}")
 parser.add_argument("tags", help="Specify which comma separated tags to scan for.")
 parser.add_argument("-r", "--region", help="Specify AWS region. Default is us-east-1.", default="us-east-1")
+parser.add_argument("--regions", help="comma separated regions, or 'all' for every region enabled in the account, to check at the same time instead of --region")
 parser.add_argument("-w", "--write", help="Write tags to the service. Default is false.", action="store_true")
 parser.add_argument("-f", "--file", help="file which holds the mappings to write", default="tag_config.yaml")
 parser.add_argument("-d", "--dry-run", help="simulate a dry run", action="store_true")
 parser.add_argument("-o", "--overwrite", help="write the tag even if it is already set", action="store_true")
-args = parser.parse_args()
-
-target_tags = args.tags.split(",")
-target_tags.sort()
-
-client = Client(args.service, args.region)
-print(f"Loading resources for service {args.service} and region '{args.region}'")
-resources = client.get_resources(target_tags)
-print(f"Loaded {len(resources)} resources.")
-
-if args.write:
-    with open(args.file) as file:
-        tags_config = yaml.safe_load(file)
-        for target_tag in target_tags:
-            if target_tag not in tags_config:
-                print(f"'{target_tag}' is missing from the yaml file. Please add it to the file or omit the tag. Aborting.")
-                exit()
-
-untagged = []
-for resource in resources:
-    print('-----')
-    print(f"Loading tags for resource {resource['tagger_id']}")
-    resource_tags = client.get_tags(resource['tagger_id'])
-    print(f"Found {len(resource_tags)} tags: {resource_tags}")
+parser.add_argument("-c", "--concurrency", help="number of resources to check and write in parallel. Default is 1.", type=int, default=1)
+parser.add_argument("--max-rate", help=f"maximum API calls per second for each API family. Default is {MAX_RATE}.", type=float, default=MAX_RATE)
+parser.add_argument("-b", "--bulk-tags", help="load existing tags in bulk with the Resource Groups Tagging API instead of one call per resource", action="store_true")
+parser.add_argument("--metrics-json", help="file to write the API call counts, bytes, retries and latency histograms per operation and the wall time per phase to as JSON")
+parser.add_argument("--metrics-prom", help="Prometheus textfile to write the same metrics to, e.g. for the node_exporter textfile collector")
+parser.add_argument("--report", help="file to write one JSON line per checked resource to, with its tags, the tags written and the action taken")
+parser.add_argument("-l", "--log-level", help="console output level: debug prints the decision of every resource, info a progress line every few seconds. Default is info.", choices=list(LOG_LEVELS), default="info")
+parser.add_argument("-t", "--types", help="comma separated resource types of the service to check, e.g. ec2:snapshot or rds:cluster-snapshot. Default is all types.")
+parser.add_argument("-m", "--missing-only", help="only check resources that are missing at least one of the tags, resources that have all of them are filtered out on the server where the API allows it", action="store_true")
+parser.add_argument("-s", "--stream", help="check and write resources while they are still being listed instead of loading them all first", action="store_true")
+parser.add_argument("--cache", help="reuse the resources and tags of a previous run from a local inventory cache", action="store_true")
+parser.add_argument("--cache-file", help=f"SQLite file of the inventory cache. Default is {DEFAULT_CACHE_PATH}.", default=DEFAULT_CACHE_PATH)
+parser.add_argument("--cache-ttl", help=f"minutes cached resources and tags are reused for. Default is {DEFAULT_TTL}.", type=float, default=DEFAULT_TTL)
+parser.add_argument("--journal", help=f"append-only file recording every tag write of a --write run, so an interrupted run can be resumed. Default is {DEFAULT_JOURNAL_PATH}.", default=DEFAULT_JOURNAL_PATH)
+parser.add_argument("--resume", help="continue an interrupted --write run: resources the journal records as tagged are skipped, failed ones are checked and written again", action="store_true")
+parser.add_argument("--role-arns", help="comma separated IAM role ARNs to assume, one per account to check")
+parser.add_argument("--role-arns-file", help="file with one IAM role ARN to assume per line, one per account to check")
+parser.add_argument("-p", "--processes", help="number of accounts to check in parallel with --role-arns. Default is the number of CPUs.", type=int, default=os.cpu_count())
+parser.add_argument("--plan-file", help="file the plan subcommand writes the planned tags to. Default is plan.jsonl.", default="plan.jsonl")
 
+apply_parser = argparse.ArgumentParser(prog=f"{parser.prog} apply", description="Write the tags of a plan written by the plan subcommand.")
+apply_parser.add_argument("plan", help="plan file to apply")
+apply_parser.add_argument("-c", "--concurrency", help="number of tag write calls in parallel. Default is 1.", type=int, default=1)
+apply_parser.add_argument("--max-rate", help=f"maximum API calls per second for each API family. Default is {MAX_RATE}.", type=float, default=MAX_RATE)
+apply_parser.add_argument("--report", help="file to write one JSON line per resource that could not be tagged to")
+apply_parser.add_argument("-l", "--log-level", help="console output level. Default is info.", choices=list(LOG_LEVELS), default="info")
+
+# Set by configure() in the main process and in every account worker process
+args = None
+target_tags = None
+matcher = None
+# Serializes the output of concurrently checked regions
+output_lock = threading.Lock()
+
+
+def configure(parsed_args, parsed_target_tags, compiled_matcher):
+    global args, target_tags, matcher
+    args = parsed_args
+    target_tags = parsed_target_tags
+    matcher = compiled_matcher
+
+
+def log(label, text, level=INFO):
+    # Lines of concurrently checked regions and accounts are prefixed with their label
+    if level < LOG_LEVELS[args.log_level]:
+        return
+    if label is not None:
+        text = "\n".join(f"[{label}] {line}" for line in text.split("\n"))
+    with output_lock:
+        print(text, flush=True)
+
+
+def check_resource(client, resource):
+    # Returns the decision for a single resource as a report record: its tags, the target tags it is missing and the tags to write.
+    # Nothing is printed here, the record is logged and reported in resource order by the caller.
+    started = time.perf_counter()
+    try:
+        resource_tags = client.get_tags(resource.tagger_id)
+    except ClientError as e:
+        if is_throttling_error(e):
+            raise
+        # Nothing is decided for a resource whose tags are unknown, guessing them could overwrite tags it already has
+        return {
+            'id': resource.tagger_id,
+            'type': resource.type,
+            'arn': resource.arn,
+            'action': 'failed',
+            'error': f"Failed to read tags: {e}",
+            'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+        }
+    missing = []
+    resource_new_tags = {}
+    # {target_tag: arn_part of the yaml file that decided the new value}
+    rules = {}
     for target_tag in target_tags:
-        print(f"Processing tag '{target_tag}'.")
         if target_tag not in resource_tags or args.overwrite:
-            if not args.overwrite:
-                print(f"Resource {resource['tagger_id']} is missing tag '{target_tag}'.")
-
-            if args.write:
-                new_tags = {}
-                if target_tag in tags_config and tags_config[target_tag] is not None:
-                    for tag_value, arn_parts in tags_config[target_tag].items():
-                        if arn_parts is None:
-                            print(f"The tag '{target_tag}'s value {tag_value} has no arn_parts in the yaml file.")
-                            continue
-                        arn_parts.sort()
-                        for arn_part in arn_parts:
-                            if arn_part in resource['tag_string']:
-                                new_tags[target_tag] = tag_value
-                else:
-                    print(f"Tag '{target_tag}' has no values in the yaml file.")
-
-                if len(new_tags) > 0:
-                    print(f"Adding tags to resource {resource['tagger_id']}: {new_tags}")
-                    if not args.dry_run:
-                        client.write_tags(resource['tagger_id'], new_tags)
-                else:
-                    print(f"No new tags for resource {resource['tagger_id']}.")
+            if args.write and matcher.has_values(target_tag):
+                rule = matcher.match_rule(target_tag, resource.tag_string)
+                if rule is not None:
+                    resource_new_tags[target_tag], rules[target_tag] = rule
+                    continue
+            if target_tag not in resource_tags:
+                missing.append(target_tag)
+    if len(resource_new_tags) > 0:
+        action = 'tag'
+    elif len(missing) > 0:
+        action = 'untagged'
+    else:
+        action = 'unchanged'
+    return {
+        'id': resource.tagger_id,
+        'type': resource.type,
+        'arn': resource.arn,
+        'tags': resource_tags,
+        'new_tags': resource_new_tags,
+        'rules': rules,
+        'missing': missing,
+        'action': action,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def decision_lines(record):
+    # Details of a single decision, only built at --log-level debug
+    lines = ['-----', f"Found {len(record['tags'])} tags for resource {record['id']}: {record['tags']}"]
+    for target_tag in target_tags:
+        if target_tag in record['new_tags']:
+            lines.append(f"Adding tag '{target_tag}': {record['new_tags'][target_tag]} (matched '{record['rules'][target_tag]}')")
+        elif target_tag not in record['missing']:
+            lines.append(f"Resource already has the tag '{target_tag}'.")
+        elif not args.write:
+            lines.append(f"Resource is missing tag '{target_tag}'. Write is disabled, use --write to activate it.")
+        elif not matcher.has_values(target_tag):
+            lines.append(f"Resource is missing tag '{target_tag}', which has no values in the yaml file.")
+        else:
+            lines.append(f"Resource is missing tag '{target_tag}', no value of the yaml file matches.")
+    return lines
+
+
+def check_resources(client, resources):
+    # Yields (resource, report record of check_resource(client, resource)) in resource order.
+    # At most concurrency * 2 checks are in flight so a streamed listing is never read far ahead of the output.
+    if client.concurrency == 1:
+        for resource in resources:
+            yield resource, check_resource(client, resource)
+        return
+    with ThreadPoolExecutor(max_workers=client.concurrency) as executor:
+        window = deque()
+        for resource in resources:
+            window.append((resource, executor.submit(check_resource, client, resource)))
+            if len(window) >= client.concurrency * 2:
+                resource, future = window.popleft()
+                yield resource, future.result()
+        while window:
+            resource, future = window.popleft()
+            yield resource, future.result()
+
+
+def write_pending(client, pending, label, writer, journal=None):
+    # Returns the number of resources that could not be tagged
+    log(label, f"Writing tags to {len(pending)} resources.", DEBUG)
+    # Every batch is journaled as soon as it is written, so the batches written before a later one raises are not written again by --resume
+    failures = client.write_tags_batch(pending, journal.record if journal is not None else None)
+    for tagger_id, error in failures.items():
+        log(label, f"Failed to write tags to resource {tagger_id}: {error}", WARNING)
+        if writer is not None:
+            writer.write({'id': tagger_id, 'new_tags': pending[tagger_id], 'action': 'failed', 'error': error})
+    return len(failures)
+
+
+def run_region(region, session, account, label, role_arn=None):
+    # Lists, checks and writes the resources of a single region. Every region gets its own client, thread pool and rate limits.
+    client = Client(args.service, region, args.concurrency, RateLimiter(args.max_rate), session, account, args.types, Metrics(), lambda text, level: log(label, text, level))
+    if args.bulk_tags:
+        log(label, f"Loaded tags for {client.load_bulk_tags()} resources in bulk.")
+    if args.missing_only:
+        log(label, f"Found {client.load_tagged_ids(target_tags)} resources that already have all tags, skipping them.")
+
+    cache = InventoryCache(args.cache_file, args.cache_ttl) if args.cache else None
+    cached_tags = {}
+    resources = None
+    if cache is not None:
+        resources = cache.load_resources(account.id, region, args.service, target_tags)
+        cached_tags = cache.load_tags(account.id, region, args.service)
+        if resources is not None:
+            resources = [resource for resource in resources if client.selected(resource.type)]
+            for resource in resources:
+                if resource.tags is not None:
+                    client.cache_tags(resource.tagger_id, resource.tags, TAGS_INVENTORY)
+            log(label, f"Loaded {len(resources)} resources for service {args.service} and region '{region}' from the cache.")
+        # Tags saved by the previous run are newer than the ones its listing returned
+        for tagger_id, tags in cached_tags.items():
+            client.cache_tags(tagger_id, tags, TAGS_INVENTORY)
+
+    # The tags of a resource are dropped once it is checked and its new tags are written, unless --cache saves them at the end.
+    # Tags loaded in bulk stay, a resource missing from a complete bulk load is read as having no tags.
+    evict = cache is None and not client.bulk_tags_complete
+
+    if resources is None:
+        log(label, f"Loading resources for service {args.service} and region '{region}'")
+        if args.stream:
+            resources = client.iter_resources(target_tags)
+        else:
+            resources = client.get_resources(target_tags)
+            log(label, f"Loaded {len(resources)} resources.")
+        # Listings of --types and --missing-only leave out resources, so they are never cached
+        if cache is not None and args.types is None and not args.missing_only:
+            resources = cache.save_resources(account.id, region, args.service, target_tags, resources)
+
+    # One record per resource decision, written in resource order
+    writer = None
+    if args.report is not None:
+        writer = ReportWriter(args.report, {'account': account.id, 'region': region, 'service': args.service})
+    # The plan gets one record per resource with new tags, with everything apply needs to write them without listing again
+    planner = None
+    if args.command == 'plan':
+        planner = ReportWriter(args.plan_file, {'account': account.id, 'role_arn': role_arn, 'region': region, 'service': args.service})
+
+    # Every tag write of a --write run is journaled, --resume skips what the journal of the interrupted run has committed
+    journal = None
+    committed = set()
+    if args.write and not args.dry_run:
+        journal_context = {'account': account.id, 'region': region, 'service': args.service, 'target_tags': ",".join(target_tags)}
+        run = None
+        if args.resume:
+            # The resumed run continues the entries of the last run, so it can be resumed again
+            run, committed = load_committed(args.journal, journal_context)
+            log(label, f"Found {len(committed)} resources tagged by the interrupted run, skipping them.")
+        journal = Journal(args.journal, {**journal_context, 'run': run if run is not None else new_run_id()})
+
+    # Resources of --missing-only that already have every tag and resources committed before --resume are counted but not checked
+    skipped = 0
+    resumed = 0
+
+    def unchecked(resources):
+        nonlocal skipped, resumed
+        for resource in resources:
+            if client.is_tagged(resource.tagger_id):
+                skipped += 1
+            elif resource.tagger_id in committed:
+                resumed += 1
             else:
-                print("Write is disabled. Tags are not updated. Use --write to activate it. Use --write AND --dry-run for a dry run.")
-                untagged.append(resource['tagger_id'])
+                yield resource
+                continue
+            if evict:
+                client.forget_tags(resource.tagger_id)
+            if writer is not None:
+                writer.write({'id': resource.tagger_id, 'type': resource.type, 'arn': resource.arn, 'action': 'skipped'})
+
+    if args.missing_only or len(committed) > 0:
+        resources = unchecked(resources)
+
+    pending = {}
+    checked = 0
+    already_tagged = 0
+    with_new_tags = 0
+    untagged = 0
+    failed = 0
+    read_failed = 0
+    # Resources passed to a tag write, S3 records of the same bucket are merged into one
+    written = 0
+    # When streaming, pending writes are flushed once they fill a full round of batch writes.
+    # Otherwise they are flushed once CHECKPOINT_SIZE resources wait for new tags, so an interrupted run has journaled most of its work.
+    flush_size = client.tag_batch_size() * client.concurrency
+    if not args.stream:
+        flush_size = max(flush_size, CHECKPOINT_SIZE)
+    verbose = LOG_LEVELS[args.log_level] <= DEBUG
+    progress = Progress()
+    previous_id = None
+    for resource, record in check_resources(client, resources):
+        # S3 yields the records of a bucket one after the other, so pending tags are only flushed between two resources
+        # and the new tags of a bucket are written together
+        if resource.tagger_id != previous_id:
+            if len(pending) >= flush_size:
+                # A dry run or plan writes nothing, its pending tags are dropped so they do not pile up for the whole run
+                if not args.dry_run:
+                    written += len(pending)
+                    failed += write_pending(client, pending, label, writer, journal)
+                if evict:
+                    for tagger_id in pending:
+                        client.forget_tags(tagger_id)
+                pending = {}
+            # The tags of a checked resource are only needed until its new tags are written
+            if evict and previous_id is not None and previous_id not in pending:
+                client.forget_tags(previous_id)
+            previous_id = resource.tagger_id
+        if record['action'] == 'failed':
+            log(label, f"Failed to check resource {resource.tagger_id}: {record['error']}", WARNING)
+        elif verbose:
+            log(label, "\n".join(decision_lines(record)), DEBUG)
+        if writer is not None:
+            writer.write(record)
+        checked += 1
+        if record['action'] == 'tag':
+            # S3 lists a bucket once per target tag, so the new tags of a resource are merged
+            pending.setdefault(resource.tagger_id, {}).update(record['new_tags'])
+            with_new_tags += 1
+            if planner is not None:
+                planner.write({key: record[key] for key in ('id', 'type', 'arn', 'tags', 'new_tags', 'rules')})
+        elif record['action'] == 'untagged':
+            untagged += 1
+        elif record['action'] == 'failed':
+            read_failed += 1
         else:
-            print(f"Resource already has the tag '{target_tag}'.")
+            already_tagged += 1
+        if progress.due():
+            log(label, f"Checked {checked} resources ({progress.rate(checked)}/s): {already_tagged} without changes, {with_new_tags} with new tags, {untagged} untagged.")
+
+    if len(pending) > 0 and not args.dry_run:
+        written += len(pending)
+        failed += write_pending(client, pending, label, writer, journal)
+    if written > 0:
+        log(label, f"Tagged {written - failed} resources, {failed} failed.")
+    if writer is not None:
+        writer.close()
+    if planner is not None:
+        planner.close()
+    if journal is not None:
+        journal.close()
+
+    if cache is not None:
+        # Only tags read or written in this run are saved, unchanged cached tags keep their age so they still expire
+        cache.save_tags(account.id, region, args.service, {tagger_id: tags for tagger_id, tags in client.tag_cache.items() if cached_tags.get(tagger_id) != tags})
+        cache.close()
+
+    return {
+        'region': region,
+        'checked': checked,
+        'skipped': skipped,
+        'resumed': resumed,
+        'already_tagged': already_tagged,
+        'with_new_tags': with_new_tags,
+        'failed': failed,
+        'read_failed': read_failed,
+        'untagged': untagged,
+        'api_stats': client.limiter.stats(),
+        'metrics': client.metrics.stats(),
+    }
+
+
+def run_regions(session, account, account_label=None, role_arn=None):
+    # Checks every requested region of an account side by side, returns {label: report}
+    if args.regions is None:
+        regions = [args.region]
+    elif services.get_adapter_class(args.service).global_service:
+        # Global services list the same resources from every region
+        log(account_label, f"Service {args.service} is global, only checking region '{args.region}'.")
+        regions = [args.region]
+    elif args.regions == "all":
+        regions = get_regions(session)
+    else:
+        regions = args.regions.split(",")
+
+    if len(regions) == 1 and account_label is None:
+        labels = [None]
+    else:
+        labels = [region if account_label is None else f"{account_label}/{region}" for region in regions]
+    if len(regions) > 1:
+        log(account_label, f"Checking {len(regions)} regions: {', '.join(regions)}")
+    # Regions only share the account details and the compiled config, so they run side by side and the sweep takes as long as the slowest region
+    with ThreadPoolExecutor(max_workers=len(regions)) as region_executor:
+        reports = list(region_executor.map(lambda region, label: run_region(region, session, account, label, role_arn), regions, labels))
+
+    for label, report in zip(labels, reports):
+        for family, stats in report['api_stats'].items():
+            log(label, f"API {family}: {stats['calls']} calls, {stats['throttles']} throttled, {stats['retries']} retries, {stats['effective_rate']} calls/s (limit {stats['rate']}/s)")
+    return dict(zip(labels, reports))
+
+
+def run_account(role_arn):
+    # Runs in an account worker process, each account gets its own session, account context and clients
+    session = assume_role_session(role_arn)
+    # Labeled with the account ID of the role, like the account's other lines, since loading the ID logs through it too
+    account = AccountContext(session, identity=role_arn, log=lambda text, level: log(role_arn.split(':')[4], text, level))
+    return run_regions(session, account, account.id, role_arn)
+
+
+def read_role_arns():
+    role_arns = []
+    if args.role_arns is not None:
+        role_arns.extend(args.role_arns.split(","))
+    if args.role_arns_file is not None:
+        with open(args.role_arns_file) as file:
+            role_arns.extend(line.strip() for line in file if line.strip() != "")
+    return role_arns
+
+
+def print_report(reports):
+    print('--- DONE ---')
+    checked = sum(report['checked'] for report in reports.values())
+    already_tagged = sum(report['already_tagged'] for report in reports.values())
+    with_new_tags = sum(report['with_new_tags'] for report in reports.values())
+    untagged = sum(report['untagged'] for report in reports.values())
+    if len(reports) > 1:
+        for label, report in reports.items():
+            print(f"[{label}] Checked {report['checked']} resources: {report['already_tagged']} without changes, {report['with_new_tags']} with new tags, {report['untagged']} untagged, {report['failed'] + report['read_failed']} failed.")
+    print(f"Checked {checked} resources: {already_tagged} without changes, {with_new_tags} with new tags, {untagged} untagged.")
+    skipped = sum(report['skipped'] for report in reports.values())
+    if skipped > 0:
+        print(f"Skipped {skipped} resources that already have all tags.")
+    resumed = sum(report['resumed'] for report in reports.values())
+    if resumed > 0:
+        print(f"Skipped {resumed} resources tagged by the interrupted run.")
+    read_failed = sum(report['read_failed'] for report in reports.values())
+    if read_failed > 0:
+        if args.report is not None:
+            print(f"Could not read the tags of {read_failed} resources, they are listed in {args.report} with the action 'failed'.")
+        else:
+            print(f"Could not read the tags of {read_failed} resources, use --report to list them.")
+    if untagged > 0:
+        if args.report is not None:
+            print(f"{untagged} resources remain untagged, they are listed in {args.report} with the action 'untagged'.")
+        else:
+            print(f"{untagged} resources remain untagged, use --report to list them.")
+    print_metrics(reports)
+    if args.command == 'plan':
+        print(f"Planned new tags for {with_new_tags} resources in {args.plan_file}, write them with: python tagger.py apply {args.plan_file}")
+
+
+def print_metrics(reports):
+    # API calls and phases of all regions and accounts, sorted by the time spent in them
+    stats = merge_stats(report['metrics'] for report in reports.values())
+    log(None, "\n".join(summary_lines(stats)))
+    # Rate limiter stats of every region and account, by the label of its log lines
+    rate_limits = {label if label is not None else report['region']: report['api_stats'] for label, report in reports.items()}
+    if args.metrics_json is not None:
+        write_json(args.metrics_json, stats, rate_limits)
+    if args.metrics_prom is not None:
+        write_prometheus(args.metrics_prom, stats, {'service': args.service}, rate_limits)
+
+
+def apply_plan():
+    # Writes the planned tags region by region. The plan is read as a stream and every region's pending writes are flushed
+    # once they fill a full round of batch writes, so the plan's size does not matter.
+    header, records = read_plan(args.plan)
+    log(None, f"Applying the plan of {header['created_at']} for service {header['service']} and tags {', '.join(header['target_tags'])}.")
+    # {(role_arn, region): Client}, resources of a plan are grouped by account and region in the order they were checked
+    clients = {}
+    pending = {}
+    labels = {}
+    planned = 0
+    failed = 0
+    writer = None
+    if args.report is not None:
+        truncate_report(args.report)
+        writer = ReportWriter(args.report, {'service': header['service']})
+    for record in records:
+        key = (record['role_arn'], record['region'])
+        if key not in clients:
+            if record['role_arn'] is None:
+                session = boto3.Session()
+                account = AccountContext(session, log=lambda text, level, label=record['account']: log(label, text, level))
+            else:
+                session = assume_role_session(record['role_arn'])
+                account = AccountContext(session, identity=record['role_arn'], log=lambda text, level, label=record['account']: log(label, text, level))
+            # A plan is only valid for the account it was made for
+            if account.id != record['account']:
+                log(None, f"The plan is for account {record['account']} but the credentials are for account {account.id}. Aborting.", ERROR)
+                exit(1)
+            labels[key] = f"{record['account']}/{record['region']}"
+            clients[key] = Client(header['service'], record['region'], args.concurrency, RateLimiter(args.max_rate), session, account, log=lambda text, level, label=labels[key]: log(label, text, level))
+            pending[key] = {}
+        client = clients[key]
+        # Flushed before a new resource is added, so the records of a resource that follow each other are written together
+        if record['id'] not in pending[key]:
+            if len(pending[key]) >= client.tag_batch_size() * client.concurrency:
+                failed += write_pending(client, pending[key], labels[key], writer)
+                pending[key] = {}
+            planned += 1
+        pending[key].setdefault(record['id'], {}).update(record['new_tags'])
+    for key, client in clients.items():
+        if len(pending[key]) > 0:
+            failed += write_pending(client, pending[key], labels[key], writer)
+    if writer is not None:
+        writer.close()
+    print('--- DONE ---')
+    print(f"Tagged {planned - failed} of {planned} planned resources, {failed} failed.")
+
+
+def parse_types(service, types):
+    # Types can be given with or without the service, e.g. ec2:snapshot or snapshot
+    resource_types = services.get_adapter_class(service).resource_types
+    selected_types = []
+    for selected_type in types.split(","):
+        selected_service, _, resource_type = selected_type.rpartition(":")
+        if selected_service not in ("", service) or resource_type not in resource_types:
+            print(f"Service {service} has no resource type '{selected_type}'. Its types are: {', '.join(resource_types)}")
+            exit()
+        selected_types.append(resource_type)
+    return selected_types
+
+
+def main():
+    if sys.argv[1:2] == ['apply']:
+        configure(apply_parser.parse_args(sys.argv[2:]), None, None)
+        apply_plan()
+        return
+    argv = sys.argv[1:]
+    command = 'check'
+    if argv[:1] == ['plan']:
+        command = 'plan'
+        argv = argv[1:]
+    parsed_args = parser.parse_args(argv)
+    parsed_args.command = command
+    if command == 'plan':
+        # A plan decides the tags like a dry run of --write, they are only written by apply
+        parsed_args.write = True
+        parsed_args.dry_run = True
+    if not services.is_supported(parsed_args.service):
+        print(f"Service {parsed_args.service} is not yet supported. Supported services: {', '.join(services.ADAPTERS)}")
+        exit()
+    if parsed_args.missing_only and parsed_args.overwrite:
+        print("--missing-only skips the resources --overwrite would write to. Use only one of them.")
+        exit()
+    if parsed_args.resume and (not parsed_args.write or parsed_args.dry_run):
+        print("--resume continues a --write run, it needs --write and cannot be combined with --dry-run.")
+        exit()
+    if parsed_args.types is not None:
+        parsed_args.types = parse_types(parsed_args.service, parsed_args.types)
+    parsed_target_tags = parsed_args.tags.split(",")
+    parsed_target_tags.sort()
+
+    compiled_matcher = None
+    if parsed_args.write:
+        with open(parsed_args.file) as file:
+            tags_config = yaml.safe_load(file)
+            for target_tag in parsed_target_tags:
+                if target_tag not in tags_config:
+                    print(f"'{target_tag}' is missing from the yaml file. Please add it to the file or omit the tag. Aborting.")
+                    exit()
+        compiled_matcher = TagMatcher(tags_config, parsed_target_tags)
+        for warning in compiled_matcher.warnings:
+            print(warning)
+    configure(parsed_args, parsed_target_tags, compiled_matcher)
+    if args.report is not None:
+        truncate_report(args.report)
+    if args.command == 'plan':
+        start_plan(args.plan_file, args.service, target_tags, args.file)
+
+    role_arns = read_role_arns()
+    if len(role_arns) == 0:
+        session = boto3.Session()
+        reports = run_regions(session, AccountContext(session, log=lambda text, level: log(None, text, level)))
+    else:
+        print(f"Checking {len(role_arns)} accounts in {args.processes} processes.")
+        # Every worker process pays the interpreter and boto3 startup once and then checks one account after another.
+        # The compiled config is handed to the workers instead of being loaded again.
+        reports = {}
+        failed_accounts = {}
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=configure, initargs=(args, target_tags, matcher)) as account_executor:
+            futures = {account_executor.submit(run_account, role_arn): role_arn for role_arn in role_arns}
+            for future in as_completed(futures):
+                try:
+                    account_reports = future.result()
+                except Exception as e:
+                    failed_accounts[futures[future]] = str(e)
+                    log(futures[future], f"Failed to check account: {e}", ERROR)
+                    continue
+                for label, report in account_reports.items():
+                    log(label, f"Checked {report['checked']} resources: {report['already_tagged']} without changes, {report['with_new_tags']} with new tags, {report['failed'] + report['read_failed']} failed.")
+                reports.update(account_reports)
+        if len(failed_accounts) > 0:
+            print(f"{len(failed_accounts)} accounts could not be checked: {list(failed_accounts)}")
+    print_report(reports)
+
 
-print('--- DONE ---')
-if len(untagged) > 0:
-    print(f"{len(untagged)} resources remain untagged: {untagged}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Resource Groups Tagging API resource type filters for each service Client supports
+# https://docs.aws.amazon.com/resourcegroupstagging/latest/APIReference/supported-services.html
+RESOURCE_TYPES = {
+    'lambda': ['lambda:function'],
+    'cloudwatchlogs': ['logs:log-group'],
+    'cloudfront': ['cloudfront:distribution'],
+    's3': ['s3:bucket'],
+    'rds': ['rds:cluster', 'rds:db', 'rds:cluster-snapshot', 'rds:snapshot'],
+    'ec2': ['ec2:instance', 'ec2:volume', 'ec2:snapshot'],
+    'elasticache': ['elasticache:cluster'],
+    'efs': ['elasticfilesystem:file-system'],
+    'ecs': ['ecs:cluster', 'ecs:service', 'ecs:task'],
+    'dynamodb': ['dynamodb:table'],
+    'opensearch': ['es:domain'],
+    'ecr': ['ecr:repository'],
+    'fsx': ['fsx:file-system'],
+}
+
+
+def is_supported(service):
+    return service in RESOURCE_TYPES
+
+
+def tagging_region(service, region):
+    # CloudFront is a global service whose tags are only visible from us-east-1
+    return 'us-east-1' if service == 'cloudfront' else region
+
+
+def arn_to_tagger_id(service, arn):
+    # Client.get_resources uses the bare resource id for some services instead of the ARN
+    if service == 'ec2':
+        # arn:aws:ec2:us-east-1:123456789012:instance/i-0123456789abcdef0
+        return arn.split('/')[-1]
+    elif service == 's3':
+        # arn:aws:s3:::bucket-name
+        return arn.split(':::', 1)[-1]
+    elif service == 'efs':
+        # arn:aws:elasticfilesystem:us-east-1:123456789012:file-system/fs-01234567
+        return arn.split('/')[-1]
+    elif service == 'cloudwatchlogs':
+        # arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/name
+        name = arn.split(':log-group:', 1)[-1]
+        return name[:-2] if name.endswith(':*') else name
+    elif service == 'opensearch':
+        # arn:aws:es:us-east-1:123456789012:domain/domain-name
+        return arn.split('/')[-1]
+    return arn
+
+
+def get_tag_map(client, service, tag_keys=(), resource_types=None):
+    # Returns {tagger_id: {key: value}} for every resource of the service that has ever been tagged.
+    # Resources that were never tagged are not returned by the tagging API.
+    # With tag_keys only resources that have all of the keys are returned, the filtering happens on the server.
+    # resource_types limits the resources to those types of the service, e.g. ['snapshot'] for EC2 snapshots.
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/resourcegroupstaggingapi.html#ResourceGroupsTaggingAPI.Paginator.GetResources
+    tag_map = {}
+    tag_filters = [{'Key': key} for key in tag_keys]
+    type_filters = [type_filter for type_filter in RESOURCE_TYPES[service] if resource_types is None or type_filter.split(':')[1] in resource_types]
+    for page in client.get_paginator('get_resources').paginate(ResourceTypeFilters=type_filters, TagFilters=tag_filters):
+        for mapping in page.get('ResourceTagMappingList', []):
+            tagger_id = arn_to_tagger_id(service, mapping['ResourceARN'])
+            tag_map[tagger_id] = {tag['Key']: tag['Value'] for tag in mapping.get('Tags', [])}
+    return tag_map
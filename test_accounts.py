@@ -0,0 +1,104 @@
+import datetime
+import functools
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import account
+import tagger
+from matcher import TagMatcher
+
+
+TAGS_CONFIG = {'IsProduction': {'false': ['development'], 'true': ['production']}}
+# {role ARN: (account ID, account alias, access key of the role's temporary credentials)}
+ACCOUNTS = {
+    'arn:aws:iam::111111111111:role/tagger': ('111111111111', 'acme-dev', 'ASIA111111111111'),
+    'arn:aws:iam::222222222222:role/tagger': ('222222222222', 'acme-prod', 'ASIA222222222222'),
+}
+
+
+def function_arn(account_id):
+    return f'arn:aws:lambda:us-east-1:{account_id}:function:orders'
+
+
+def account_responses(account_id, alias):
+    # {client name: [(operation, response, expected params)]} of a run over the single Lambda function of the account
+    arn = function_arn(account_id)
+    return {
+        'sts': [('get_caller_identity', {'Account': account_id, 'Arn': f'arn:aws:sts::{account_id}:assumed-role/tagger/service-tagger', 'UserId': 'AROA:service-tagger'}, {})],
+        'iam': [('list_account_aliases', {'AccountAliases': [alias], 'IsTruncated': False}, {})],
+        'lambda': [
+            ('list_functions', {'Functions': [{'FunctionName': 'orders', 'FunctionArn': arn}]}, {}),
+            ('list_tags', {'Tags': {}}, {'Resource': arn}),
+        ],
+        'resourcegroupstaggingapi': [
+            ('tag_resources', {'FailedResourcesMap': {}}, {'ResourceARNList': [arn], 'Tags': {'IsProduction': 'false' if 'dev' in alias else 'true'}}),
+        ],
+    }
+
+
+@pytest.fixture
+def stubbed_accounts(monkeypatch, tmp_path):
+    # The default session only answers assume_role. The session of each assumed role gets stubbed clients that answer
+    # the calls of its own account, a call made with the wrong credentials finds no response and fails the run.
+    real_session = boto3.Session
+    base_session = real_session(aws_access_key_id='base', aws_secret_access_key='base', region_name='us-east-1')
+    base_sts = base_session.client('sts')
+    stubbers = [Stubber(base_sts)]
+    for role_arn, (_, _, access_key) in ACCOUNTS.items():
+        stubbers[0].add_response('assume_role', {
+            'Credentials': {'AccessKeyId': access_key, 'SecretAccessKey': 'secret', 'SessionToken': 'token', 'Expiration': datetime.datetime(2030, 1, 1)},
+        }, {'RoleArn': role_arn, 'RoleSessionName': 'service-tagger'})
+    stubbers[0].activate()
+    base_session.client = lambda name, *args, **kwargs: base_sts
+
+    responses = {access_key: account_responses(account_id, alias) for account_id, alias, access_key in ACCOUNTS.values()}
+    # (access key, client name) of every client the assumed sessions created
+    created = []
+
+    def session_factory(**kwargs):
+        if not kwargs:
+            return base_session
+        session = real_session(**kwargs)
+        access_key = kwargs['aws_access_key_id']
+        real_client = session.client
+
+        def client(name, *args, **client_kwargs):
+            boto_client = real_client(name, *args, **client_kwargs)
+            stubber = Stubber(boto_client)
+            for operation, response, expected_params in responses[access_key].pop(name, []):
+                stubber.add_response(operation, response, expected_params)
+            stubber.activate()
+            stubbers.append(stubber)
+            created.append((access_key, name))
+            return boto_client
+
+        session.client = client
+        return session
+
+    monkeypatch.setattr(account.boto3, 'Session', session_factory)
+    monkeypatch.setattr(tagger, 'AccountContext', functools.partial(account.AccountContext, cache_path=str(tmp_path / 'accounts.json')))
+    parsed_args = tagger.parser.parse_args(['lambda', 'IsProduction', '--write', '--concurrency', '1', '--log-level', 'error', '--journal', str(tmp_path / 'journal.jsonl')])
+    parsed_args.command = 'check'
+    tagger.configure(parsed_args, ['IsProduction'], TagMatcher(TAGS_CONFIG, ['IsProduction']))
+    yield responses, created, stubbers
+    for stubber in stubbers:
+        stubber.deactivate()
+
+
+def test_run_account_uses_the_assumed_role_session(stubbed_accounts):
+    responses, created, stubbers = stubbed_accounts
+    reports = {role_arn: tagger.run_account(role_arn) for role_arn in ACCOUNTS}
+
+    # Every call of both runs was answered, and only the assumed sessions created service clients
+    for stubber in stubbers:
+        stubber.assert_no_pending_responses()
+    assert all(len(pending) == 0 for pending in responses.values())
+    assert {access_key for access_key, _ in created} == {'ASIA111111111111', 'ASIA222222222222'}
+
+    # Each account reports under its own label, and each got the IsProduction value of its own alias
+    for role_arn, (account_id, _, _) in ACCOUNTS.items():
+        assert list(reports[role_arn]) == [f'{account_id}/us-east-1']
+        report = reports[role_arn][f'{account_id}/us-east-1']
+        assert (report['checked'], report['with_new_tags'], report['failed']) == (1, 1, 0)
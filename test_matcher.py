@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from matcher import AhoCorasick, TagMatcher, nested_loop_match
+
+
+def random_config(rng, alphabet, values, parts, part_length):
+    return {'Tag': {f'value-{index}': [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, part_length))) for _ in range(rng.randint(1, parts))] for index in range(rng.randint(1, values))}}
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_nested_loop_on_random_inputs(seed):
+    # A small alphabet makes overlapping parts, parts that are prefixes of each other and repeated parts common
+    rng = random.Random(seed)
+    for _ in range(200):
+        tags_config = random_config(rng, 'ab-', values=5, parts=4, part_length=4)
+        matcher = TagMatcher(tags_config, ['Tag'])
+        for _ in range(20):
+            tag_string = ''.join(rng.choice('ab-') for _ in range(rng.randint(0, 12)))
+            assert matcher.match('Tag', tag_string) == nested_loop_match(tags_config, 'Tag', tag_string), (tags_config, tag_string)
+
+
+def test_empty_part_matches_every_tag_string():
+    tags_config = {'Tag': {'first': ['prod'], 'second': ['']}}
+    matcher = TagMatcher(tags_config, ['Tag'])
+    for tag_string in ['', 'prod', 'arn:aws:s3:::bucket']:
+        assert matcher.match('Tag', tag_string) == nested_loop_match(tags_config, 'Tag', tag_string) == 'second'
+    assert AhoCorasick(['']).search('') == {0}
+
+
+def test_overlapping_parts_last_value_wins():
+    tags_config = {'Tag': {'first': ['production'], 'second': ['duct'], 'third': ['xyz']}}
+    matcher = TagMatcher(tags_config, ['Tag'])
+    assert matcher.match('Tag', 'arn-production') == nested_loop_match(tags_config, 'Tag', 'arn-production') == 'second'
+    assert matcher.match_rule('Tag', 'arn-production') == ('second', 'duct')
+
+
+def test_prefix_part():
+    tags_config = {'Tag': {'long': ['prod'], 'short': ['pro'], 'other': ['production']}}
+    matcher = TagMatcher(tags_config, ['Tag'])
+    for tag_string in ['pro', 'prod', 'production', 'pr']:
+        assert matcher.match('Tag', tag_string) == nested_loop_match(tags_config, 'Tag', tag_string)
+    assert matcher.match('Tag', 'production') == 'other'
+    assert matcher.match('Tag', 'pr') is None
+
+
+def test_match_rule_returns_last_matching_part_of_the_value():
+    matcher = TagMatcher({'Tag': {'value': ['a', 'b', 'c']}}, ['Tag'])
+    assert matcher.match_rule('Tag', 'a-b') == ('value', 'b')
+    assert matcher.match_rule('Tag', 'x') is None
+
+
+def test_value_without_parts_is_skipped_with_a_warning():
+    tags_config = {'Tag': {'empty': None, 'value': ['prod']}}
+    matcher = TagMatcher(tags_config, ['Tag'])
+    assert matcher.match('Tag', 'prod') == nested_loop_match(tags_config, 'Tag', 'prod') == 'value'
+    assert matcher.warnings == ["The tag 'Tag's value empty has no arn_parts in the yaml file."]
+
+
+def test_tag_without_values_is_not_compiled():
+    matcher = TagMatcher({'Tag': None}, ['Tag', 'Missing'])
+    assert not matcher.has_values('Tag')
+    assert not matcher.has_values('Missing')
+
+
+def test_non_string_yaml_values():
+    # yaml reads unquoted true and 2024 as a bool and an int. Values are written as they are,
+    # parts are matched by their string form where the nested loop raised a TypeError.
+    tags_config = {'Tag': {True: ['prod'], 'year': [2024]}}
+    matcher = TagMatcher(tags_config, ['Tag'])
+    assert matcher.match('Tag', 'arn-prod') is True
+    assert matcher.match('Tag', 'backup-2024') == 'year'
+    with pytest.raises(TypeError):
+        nested_loop_match(tags_config, 'Tag', 'backup-2024')
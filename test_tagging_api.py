@@ -0,0 +1,86 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import tagging_api
+
+
+@pytest.fixture
+def client():
+    return boto3.client('resourcegroupstaggingapi', region_name='us-east-1', aws_access_key_id='testing', aws_secret_access_key='testing')
+
+
+def mapping(arn, tags):
+    return {'ResourceARN': arn, 'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+
+
+# (service, ARN the tagging API returns, tagger_id the service's adapter lists the resource as)
+ARNS = [
+    ('ec2', 'arn:aws:ec2:us-east-1:123456789012:instance/i-0123456789abcdef0', 'i-0123456789abcdef0'),
+    ('ec2', 'arn:aws:ec2:us-east-1:123456789012:volume/vol-0123456789abcdef0', 'vol-0123456789abcdef0'),
+    # Snapshots and AMIs have no account in their ARN
+    ('ec2', 'arn:aws:ec2:us-east-1::snapshot/snap-0123456789abcdef0', 'snap-0123456789abcdef0'),
+    ('ec2', 'arn:aws:ec2:us-east-1::image/ami-0123456789abcdef0', 'ami-0123456789abcdef0'),
+    ('cloudwatchlogs', 'arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/name', '/aws/lambda/name'),
+    ('cloudwatchlogs', 'arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/name:*', '/aws/lambda/name'),
+    ('cloudwatchlogs', 'arn:aws:logs:us-east-1:123456789012:log-group:plain-name:*', 'plain-name'),
+    ('s3', 'arn:aws:s3:::bucket-name', 'bucket-name'),
+    ('s3', 'arn:aws:s3:::bucket.with.dots', 'bucket.with.dots'),
+    ('efs', 'arn:aws:elasticfilesystem:us-east-1:123456789012:file-system/fs-01234567', 'fs-01234567'),
+    ('opensearch', 'arn:aws:es:us-east-1:123456789012:domain/domain-name', 'domain-name'),
+    # The other services list their resources by ARN
+    ('lambda', 'arn:aws:lambda:us-east-1:123456789012:function:name', 'arn:aws:lambda:us-east-1:123456789012:function:name'),
+    ('rds', 'arn:aws:rds:us-east-1:123456789012:db:name', 'arn:aws:rds:us-east-1:123456789012:db:name'),
+    ('ecs', 'arn:aws:ecs:us-east-1:123456789012:service/cluster/name', 'arn:aws:ecs:us-east-1:123456789012:service/cluster/name'),
+    ('dynamodb', 'arn:aws:dynamodb:us-east-1:123456789012:table/name', 'arn:aws:dynamodb:us-east-1:123456789012:table/name'),
+    ('ecr', 'arn:aws:ecr:us-east-1:123456789012:repository/name', 'arn:aws:ecr:us-east-1:123456789012:repository/name'),
+    ('cloudfront', 'arn:aws:cloudfront::123456789012:distribution/E123', 'arn:aws:cloudfront::123456789012:distribution/E123'),
+    ('elasticache', 'arn:aws:elasticache:us-east-1:123456789012:cluster:name', 'arn:aws:elasticache:us-east-1:123456789012:cluster:name'),
+]
+
+
+def test_every_listed_service_is_mapped():
+    # The FSx adapter does not list resources yet
+    assert {service for service, _, _ in ARNS} == set(tagging_api.RESOURCE_TYPES) - {'fsx'}
+
+
+@pytest.mark.parametrize('service,arn,tagger_id', ARNS)
+def test_arn_to_tagger_id(service, arn, tagger_id):
+    assert tagging_api.arn_to_tagger_id(service, arn) == tagger_id
+
+
+@pytest.mark.parametrize('service,arn,tagger_id', ARNS)
+def test_get_tag_map_keys_tags_by_tagger_id(client, service, arn, tagger_id):
+    with Stubber(client) as stubber:
+        stubber.add_response('get_resources', {'ResourceTagMappingList': [mapping(arn, {'Environment': 'prod'})]},
+                             {'ResourceTypeFilters': tagging_api.RESOURCE_TYPES[service], 'TagFilters': []})
+        assert tagging_api.get_tag_map(client, service) == {tagger_id: {'Environment': 'prod'}}
+        stubber.assert_no_pending_responses()
+
+
+def test_get_tag_map_follows_pagination(client):
+    expected_params = {'ResourceTypeFilters': tagging_api.RESOURCE_TYPES['ec2'], 'TagFilters': []}
+    with Stubber(client) as stubber:
+        stubber.add_response('get_resources', {
+            'ResourceTagMappingList': [mapping('arn:aws:ec2:us-east-1:123456789012:instance/i-1', {'Name': 'first'})],
+            'PaginationToken': 'page-2',
+        }, expected_params)
+        stubber.add_response('get_resources', {
+            'ResourceTagMappingList': [
+                mapping('arn:aws:ec2:us-east-1::snapshot/snap-2', {'Name': 'second'}),
+                # Resources whose tags were all removed are still returned, with no tags
+                {'ResourceARN': 'arn:aws:ec2:us-east-1:123456789012:volume/vol-3'},
+            ],
+            'PaginationToken': '',
+        }, {**expected_params, 'PaginationToken': 'page-2'})
+        tag_map = tagging_api.get_tag_map(client, 'ec2')
+        stubber.assert_no_pending_responses()
+    assert tag_map == {'i-1': {'Name': 'first'}, 'snap-2': {'Name': 'second'}, 'vol-3': {}}
+
+
+def test_get_tag_map_filters_on_the_server(client):
+    with Stubber(client) as stubber:
+        stubber.add_response('get_resources', {'ResourceTagMappingList': [mapping('arn:aws:ec2:us-east-1::snapshot/snap-1', {'IsProduction': 'true', 'Team': 'a'})]},
+                             {'ResourceTypeFilters': ['ec2:snapshot'], 'TagFilters': [{'Key': 'IsProduction'}, {'Key': 'Team'}]})
+        assert tagging_api.get_tag_map(client, 'ec2', ['IsProduction', 'Team'], ['snapshot']) == {'snap-1': {'IsProduction': 'true', 'Team': 'a'}}
+        stubber.assert_no_pending_responses()